@@ -0,0 +1,237 @@
+"""Асинхронные версии нагруженных эндпоинтов для запуска под ASGI.
+
+Подключаются вместо представлений DRF при ASYNC_API_VIEWS = True.
+Запросы выполняются через асинхронный ORM Django, а в поток уходят
+только операции, которым нужна транзакция или prefetch_related.
+"""
+from http import HTTPStatus
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from recipes.models import Favorite, Purchase, Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from users.models import Subscription, User
+
+from .authentication import token_cache
+from .filters import RecipeFilter
+from .pagination import RecipePagination
+from .serializers import (RecipeSerializer, RecipeShortSerializer,
+                          SubscriptionSerializer)
+from .utils import (add_recipe_relation, get_recipes_limit,
+                    remove_recipe_relation)
+from .views import RecipeViewSet
+
+recipe_viewset = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+
+
+def async_api_view(*methods):
+    """Проверяет метод запроса и отключает CSRF, как APIView в DRF."""
+    def decorator(view):
+        async def wrapped_view(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        wrapped_view.csrf_exempt = True
+        return wrapped_view
+    return decorator
+
+
+def json_response(data, status=HTTPStatus.OK):
+    return JsonResponse(
+        data, status=status, safe=False,
+        json_dumps_params={'ensure_ascii': False}
+    )
+
+
+async def authenticate(request):
+    """Аутентификация по токену, как TokenAuthentication в DRF.
+
+    Возвращает None, если передан недействительный токен.
+    """
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword != 'Token' or not key:
+        return AnonymousUser()
+    key = key.strip()
+    token = await token_cache.aget(key)
+    if token is None:
+        token = await Token.objects.select_related('user').filter(
+            key=key).afirst()
+        if token is None or not token.user.is_active:
+            return None
+        await token_cache.aset(token)
+    return token.user
+
+
+async def get_authenticated_user(request):
+    user = await authenticate(request)
+    if user is None:
+        return None, json_response(
+            {'detail': 'Недопустимый токен.'}, HTTPStatus.UNAUTHORIZED)
+    if not user.is_authenticated:
+        return None, json_response(
+            {'detail': 'Учетные данные не были предоставлены.'},
+            HTTPStatus.UNAUTHORIZED
+        )
+    return user, None
+
+
+async def toggle_recipe_relation(request, recipe_id, modelname):
+    user, error = await get_authenticated_user(request)
+    if error:
+        return error
+    if request.method == 'DELETE':
+        if not await sync_to_async(remove_recipe_relation)(
+                user, recipe_id, modelname):
+            return json_response(
+                {'detail': 'Страница не найдена.'}, HTTPStatus.NOT_FOUND)
+        return HttpResponse(status=HTTPStatus.NO_CONTENT)
+    recipe = await Recipe.objects.filter(pk=recipe_id).afirst()
+    if recipe is None:
+        return json_response(
+            {'detail': 'Страница не найдена.'}, HTTPStatus.NOT_FOUND)
+    if not await sync_to_async(add_recipe_relation)(user, recipe, modelname):
+        return json_response('Рецепт уже добавлен', HTTPStatus.BAD_REQUEST)
+    return json_response(
+        RecipeShortSerializer(recipe).data, HTTPStatus.CREATED)
+
+
+@async_api_view('POST', 'DELETE')
+async def favorite(request, recipe_id):
+    return await toggle_recipe_relation(request, recipe_id, Favorite)
+
+
+@async_api_view('POST', 'DELETE')
+async def shopping_cart(request, recipe_id):
+    return await toggle_recipe_relation(request, recipe_id, Purchase)
+
+
+@async_api_view('POST', 'DELETE')
+async def subscribe(request, user_id):
+    user, error = await get_authenticated_user(request)
+    if error:
+        return error
+    if request.method == 'DELETE':
+        deleted, _ = await Subscription.objects.filter(
+            author_id=user_id, user=user).adelete()
+        if not deleted:
+            return json_response(
+                {'detail': 'Страница не найдена.'}, HTTPStatus.NOT_FOUND)
+        return HttpResponse(status=HTTPStatus.NO_CONTENT)
+    drf_request = Request(request)
+    try:
+        recipes_limit = get_recipes_limit(drf_request)
+    except ValidationError as error:
+        return json_response(error.detail, HTTPStatus.BAD_REQUEST)
+    author = await User.objects.filter(pk=user_id).afirst()
+    if author is None:
+        return json_response(
+            {'detail': 'Страница не найдена.'}, HTTPStatus.NOT_FOUND)
+    if author == user:
+        return json_response(
+            'Нельзя подписаться на себя', HTTPStatus.BAD_REQUEST)
+    subscription, created = await Subscription.objects.aget_or_create(
+        author=author, user=user)
+    if not created:
+        return json_response(
+            'Вы уже подписаны на данного автора', HTTPStatus.BAD_REQUEST)
+    recipes = Recipe.objects.filter(author=author)
+    subscription.subscribed = True
+    subscription.recipes_count = await recipes.acount()
+    latest_recipes = [
+        recipe async for recipe in recipes[:recipes_limit]]
+    serializer = SubscriptionSerializer(subscription, context={
+        'request': drf_request,
+        'latest_recipes': {author.id: latest_recipes},
+    })
+    return json_response(serializer.data, HTTPStatus.CREATED)
+
+
+def get_page_links(url, page_query_param, page_number, has_next):
+    next_link = previous_link = None
+    if has_next:
+        next_link = replace_query_param(
+            url, page_query_param, page_number + 1)
+    if page_number == 2:
+        previous_link = remove_query_param(url, page_query_param)
+    elif page_number > 2:
+        previous_link = replace_query_param(
+            url, page_query_param, page_number - 1)
+    return next_link, previous_link
+
+
+async def paginate_by_page(queryset, pagination, request):
+    """Обычная постраничная пагинация через асинхронный ORM."""
+    page_size = pagination.get_page_size(request)
+    try:
+        page_number = int(request.query_params.get(
+            pagination.page_query_param, 1))
+    except ValueError:
+        page_number = 0
+    count = await queryset.acount()
+    if page_number < 1 or (page_number - 1) * page_size >= max(count, 1):
+        raise NotFound('Неправильная страница')
+    offset = (page_number - 1) * page_size
+    queryset = queryset.order_by(*pagination.get_ordering(queryset))
+    recipes = [
+        recipe async for recipe in queryset[offset:offset + page_size]]
+    next_link, previous_link = get_page_links(
+        request.build_absolute_uri(), pagination.page_query_param,
+        page_number, offset + page_size < count
+    )
+    return recipes, lambda data: {
+        'count': count,
+        'next': next_link,
+        'previous': previous_link,
+        'results': data,
+    }
+
+
+async def paginate_without_offset_count(queryset, pagination, request):
+    """Курсорный режим и режим без подсчета берутся из RecipePagination."""
+    recipes = await sync_to_async(pagination.paginate_queryset)(
+        queryset, request)
+    return recipes, lambda data: pagination.get_paginated_response(data).data
+
+
+@async_api_view('GET', 'POST')
+async def recipe_list(request):
+    """Список рецептов с теми же фильтрами и режимами пагинации.
+
+    Создание рецепта передается представлению DRF.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(recipe_viewset)(request)
+    user = await authenticate(request)
+    if user is None:
+        return json_response(
+            {'detail': 'Недопустимый токен.'}, HTTPStatus.UNAUTHORIZED)
+    drf_request = Request(request)
+    drf_request.user = user
+    filterset = RecipeFilter(
+        request.GET,
+        queryset=Recipe.objects.with_user_flags(user).select_related(
+            'author'),
+        request=drf_request
+    )
+    if not await sync_to_async(filterset.is_valid)():
+        return json_response(filterset.errors, HTTPStatus.BAD_REQUEST)
+    queryset = await sync_to_async(lambda: filterset.qs)()
+    pagination = RecipePagination()
+    paginate = paginate_by_page
+    if pagination.get_mode(drf_request) is not None:
+        paginate = paginate_without_offset_count
+    try:
+        recipes, get_payload = await paginate(
+            queryset, pagination, drf_request)
+    except NotFound as error:
+        return json_response(
+            {'detail': error.detail}, HTTPStatus.NOT_FOUND)
+    await sync_to_async(prefetch_related_objects)(
+        recipes, *Recipe.objects.get_prefetches())
+    return json_response(get_payload(RecipeSerializer(
+        recipes, many=True, context={'request': drf_request}).data))
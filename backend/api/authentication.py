@@ -0,0 +1,118 @@
+import pickle
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE_KEY = 'auth_token:{}'
+
+
+def get_token_cache_key(key):
+    """Ключ кэша по хэшу токена, чтобы токен не попадал в кэш открыто."""
+    return TOKEN_CACHE_KEY.format(sha256(key.encode()).hexdigest())
+
+
+class TokenCache:
+    """Кэш токенов с пользователями, ограниченный по размеру и времени жизни.
+
+    Записи хранятся в памяти процесса в сериализованном виде, чтобы
+    запросы не делили один объект пользователя, и вытесняются по LRU.
+    Если задан TOKEN_CACHE_ALIAS, используется общий кэш Django,
+    и сброс записи виден всем процессам сразу.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def shared(self):
+        alias = settings.TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        cache_key = get_token_cache_key(key)
+        if self.shared is not None:
+            return self.shared.get(cache_key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires <= monotonic():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+        return pickle.loads(data)
+
+    def set(self, token):
+        cache_key = get_token_cache_key(token.key)
+        if self.shared is not None:
+            self.shared.set(cache_key, token, settings.TOKEN_CACHE_TIMEOUT)
+            return
+        data = pickle.dumps(token, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[cache_key] = (
+                data, monotonic() + settings.TOKEN_CACHE_TIMEOUT)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > settings.TOKEN_CACHE_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    async def aget(self, key):
+        """get для асинхронных представлений: общий кэш может ходить
+        в базу данных, поэтому читается через асинхронный API кэша."""
+        if self.shared is not None:
+            return await self.shared.aget(get_token_cache_key(key))
+        return self.get(key)
+
+    async def aset(self, token):
+        if self.shared is not None:
+            await self.shared.aset(
+                get_token_cache_key(token.key), token,
+                settings.TOKEN_CACHE_TIMEOUT)
+            return
+        self.set(token)
+
+    def delete(self, *keys):
+        cache_keys = [get_token_cache_key(key) for key in keys]
+        if self.shared is not None:
+            self.shared.delete_many(cache_keys)
+            return
+        with self._lock:
+            for cache_key in cache_keys:
+                self._entries.pop(cache_key, None)
+
+    def delete_user(self, user_id):
+        """Сбрасывает записи всех токенов пользователя."""
+        self.delete(*Token.objects.filter(
+            user_id=user_id).values_list('key', flat=True))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для уже известных токенов.
+
+    Пользователь по токену берется из token_cache, записи сбрасываются
+    сигналами при выходе, смене пароля и деактивации пользователя.
+    При нескольких процессах без общего кэша выход из системы
+    замечается остальными процессами через TOKEN_CACHE_TIMEOUT.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is not None:
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(token)
+        return user, token
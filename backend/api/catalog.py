@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+from time import time_ns
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_RESPONSES_MAX_SIZE = 1000
+
+
+def get_version(key):
+    """Возвращает номер версии закэшированных данных.
+
+    Версии хранятся в общем кэше (Redis), поэтому изменение, сделанное
+    в одном воркере, сразу видят все остальные.
+    """
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def bump_version(key):
+    """Делает недействительными данные, закэшированные под версией."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time_ns(), timeout=None)
+
+
+def get_catalog_version():
+    """Возвращает текущую версию справочников тегов и ингредиентов."""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Делает недействительными все сохраненные ответы справочников."""
+    bump_version(CATALOG_VERSION_KEY)
+
+
+class CatalogResponseCache:
+    """Готовые ответы справочников в памяти процесса.
+
+    Ответ хранится вместе с версией справочника, под которой он
+    построен, и вытесняется по LRU. В общем кэше проверяется только
+    версия, поэтому ответы на любые строки запроса не занимают его.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > CATALOG_RESPONSES_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_responses = CatalogResponseCache()
+
+
+def cached_catalog_response(request, get_response):
+    """Отдает готовые байты ответа справочника со строгим ETag.
+
+    Ответ строится через get_response только при первом запросе
+    к текущей версии справочника в процессе, повторные запросы
+    с совпадающим If-None-Match получают 304 без обращения к БД
+    и сериализатору: читается только версия из общего кэша.
+    """
+    version = get_catalog_version()
+    key = f'{request.path}?{request.META.get("QUERY_STRING", "")}'
+    cached = catalog_responses.get(key, version)
+    if cached is None:
+        content = JSONRenderer().render(get_response().data)
+        cached = (f'"{sha1(content).hexdigest()}"', content)
+        catalog_responses.set(key, version, cached)
+    etag, content = cached
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if etag in etags or '*' in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,85 @@
+import asyncio
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+PRIMARY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@dataclass
+class RoutingState:
+    """Куда направлять чтение в рамках одного запроса."""
+    read_alias: str = DEFAULT_DB_ALIAS
+    wrote: bool = False
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+class ReplicaRouter:
+    """Направляет чтение безопасных запросов на реплики из DATABASE_REPLICAS.
+
+    Вне запроса, внутри транзакции и после первой записи в запросе
+    чтение идет в основную базу, запись — всегда в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.read_alias = DEFAULT_DB_ALIAS
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+def start_routing(request):
+    """Выбирает базу для чтения на время запроса.
+
+    Реплика выбирается одна на весь запрос, чтобы ответ не собирался
+    из реплик с разным отставанием. Клиент, который недавно писал,
+    читает из основной базы, пока у него есть кука PRIMARY_COOKIE.
+    """
+    state = RoutingState()
+    if (settings.DATABASE_REPLICAS and request.method in SAFE_METHODS
+            and PRIMARY_COOKIE not in request.COOKIES):
+        state.read_alias = random.choice(settings.DATABASE_REPLICAS)
+    return state, routing_state.set(state)
+
+
+def finish_routing(response, state, token):
+    """Закрепляет клиента за основной базой после его записи."""
+    routing_state.reset(token)
+    if state.wrote and settings.DATABASE_REPLICAS:
+        response.set_cookie(
+            PRIMARY_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True, samesite='Lax'
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            state, token = start_routing(request)
+            response = await get_response(request)
+            return finish_routing(response, state, token)
+    else:
+        def middleware(request):
+            state, token = start_routing(request)
+            response = get_response(request)
+            return finish_routing(response, state, token)
+    return middleware
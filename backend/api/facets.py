@@ -0,0 +1,49 @@
+from hashlib import sha1
+
+from django.core.cache import cache
+from django.db.models import Count
+from recipes.models import RecipeTag, Tag
+
+from .catalog import CATALOG_CACHE_TIMEOUT, get_catalog_version, get_version
+
+RECIPES_VERSION_KEY = 'recipes_version'
+
+
+def get_user_recipes_version_key(user_id):
+    return f'user_recipes_version:{user_id}'
+
+
+def get_tag_facets(filterset, user):
+    """Считает рецепты по тегам для условий фильтра.
+
+    Счетчики вместе со списком тегов кэшируются по набору условий
+    и версиям рецептов, тегов и, для фильтров по избранному и покупкам,
+    версии данных пользователя.
+    """
+    data = filterset.form.cleaned_data
+    signature = [
+        get_catalog_version(),
+        get_version(RECIPES_VERSION_KEY),
+        data.get('author') or '',
+        int(bool(data.get('is_favorited'))),
+        int(bool(data.get('is_in_shopping_cart'))),
+        sha1((data.get('search') or '').encode()).hexdigest(),
+    ]
+    if user.is_authenticated and (
+            data.get('is_favorited') or data.get('is_in_shopping_cart')):
+        signature += [
+            user.id, get_version(get_user_recipes_version_key(user.id))]
+    key = 'tag_facets:' + ':'.join(map(str, signature))
+    facets = cache.get(key)
+    if facets is None:
+        counts = dict(RecipeTag.objects.filter(
+            recipe__in=filterset.qs.values('pk')
+        ).values('tag_id').annotate(
+            count=Count('id')
+        ).order_by().values_list('tag_id', 'count'))
+        facets = [
+            {'id': tag_id, 'slug': slug, 'count': counts.get(tag_id, 0)}
+            for tag_id, slug in Tag.objects.values_list('id', 'slug')
+        ]
+        cache.set(key, facets, CATALOG_CACHE_TIMEOUT)
+    return facets
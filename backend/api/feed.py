@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscription, User
+
+FEED_PULL_AUTHORS_TIMEOUT = 300
+FEED_BATCH_SIZE = 1000
+FEED_TRIM_SLACK = 50
+
+
+def get_pull_authors_key(user_id):
+    return f'feed_pull_authors:{user_id}'
+
+
+def get_pull_author_ids(user):
+    """Возвращает авторов из подписок, чьи рецепты не рассылаются в ленты.
+
+    У таких авторов больше FEED_FANOUT_MAX_FOLLOWERS подписчиков, и их
+    рецепты выбираются при чтении ленты. Список кэшируется ненадолго:
+    он меняется, только когда автор пересекает порог подписчиков.
+    """
+    key = get_pull_authors_key(user.id)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(Subscription.objects.filter(
+            user=user
+        ).annotate(
+            followers_count=Count('author__following')
+        ).filter(
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('author_id', flat=True))
+        cache.set(key, author_ids, FEED_PULL_AUTHORS_TIMEOUT)
+    return author_ids
+
+
+def get_feed(user):
+    """Рецепты авторов, на которых подписан пользователь.
+
+    Записей в ленте не больше FEED_MAX_LENGTH + FEED_TRIM_SLACK,
+    поэтому подзапрос по ним дешевый и не зависит от общего числа рецептов.
+    """
+    condition = Q(pk__in=FeedEntry.objects.filter(
+        user=user).values('recipe_id'))
+    pull_author_ids = get_pull_author_ids(user)
+    if pull_author_ids:
+        condition |= Q(author_id__in=pull_author_ids)
+    return Recipe.objects.for_user(user).filter(condition)
+
+
+def trim_feeds(user_ids):
+    """Удаляет из лент пользователей записи сверх FEED_MAX_LENGTH."""
+    ranked = FeedEntry.objects.filter(user_id__in=user_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('recipe__pub_date').desc(), F('recipe_id').desc()],
+        )
+    ).values('id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    table = connection.ops.quote_name(FeedEntry._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE id IN (SELECT ranked.id FROM ({sql}) '
+            'ranked WHERE ranked.row_number > %s)',
+            (*params, settings.FEED_MAX_LENGTH)
+        )
+
+
+def get_overflowing_feeds(user_ids):
+    """Возвращает пользователей, чьи ленты пора обрезать.
+
+    Лента обрезается, только когда в ней накопилось больше
+    FEED_MAX_LENGTH + FEED_TRIM_SLACK записей, поэтому окно по ней
+    считается один раз на FEED_TRIM_SLACK новых рецептов, а не при
+    каждой публикации. Сам подсчет идет по индексу без сортировки.
+    """
+    return list(FeedEntry.objects.filter(
+        user_id__in=user_ids
+    ).values('user_id').annotate(
+        entries=Count('id')
+    ).filter(
+        entries__gt=settings.FEED_MAX_LENGTH + FEED_TRIM_SLACK
+    ).order_by().values_list('user_id', flat=True))
+
+
+def fan_out_recipe(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора.
+
+    Для авторов с большим числом подписчиков рассылка пропускается,
+    их рецепты попадают в ленту при чтении.
+    """
+    follower_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True)[
+        :settings.FEED_FANOUT_MAX_FOLLOWERS + 1])
+    if not follower_ids or (
+            len(follower_ids) > settings.FEED_FANOUT_MAX_FOLLOWERS):
+        return
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe=recipe)
+         for user_id in follower_ids],
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    overflowing_ids = get_overflowing_feeds(follower_ids)
+    if overflowing_ids:
+        trim_feeds(overflowing_ids)
+
+
+def backfill_feed(user_id, author_ids):
+    """Добавляет в ленту последние рецепты новых подписок."""
+    cache.delete(get_pull_authors_key(user_id))
+    push_author_ids = User.objects.filter(id__in=author_ids).annotate(
+        followers_count=Count('following')
+    ).filter(
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values('id')
+    recipe_ids = Recipe.objects.filter(
+        author_id__in=push_author_ids
+    ).values_list('id', flat=True)[:settings.FEED_MAX_LENGTH]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe_id=recipe_id)
+         for recipe_id in recipe_ids],
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    trim_feeds([user_id])
+
+
+def rebuild_feeds(user_ids):
+    """Заново заполняет ленты пользователей одним INSERT ... SELECT.
+
+    Рецепты авторов без рассылки по подпискам нумеруются окном
+    в пределах подписчика, и в ленту попадают первые FEED_MAX_LENGTH.
+    """
+    FeedEntry.objects.filter(user_id__in=user_ids).delete()
+    push_author_ids = User.objects.annotate(
+        followers_count=Count('following')
+    ).filter(
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values('id')
+    ranked = Subscription.objects.filter(
+        user_id__in=user_ids, author_id__in=push_author_ids
+    ).annotate(
+        feed_recipe_id=F('author__recipe_author__id'),
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[
+                F('author__recipe_author__pub_date').desc(),
+                F('author__recipe_author__id').desc(),
+            ],
+        )
+    ).filter(feed_recipe_id__isnull=False).values(
+        'user_id', 'feed_recipe_id', 'row_number')
+    sql, params = ranked.query.sql_with_params()
+    table = connection.ops.quote_name(FeedEntry._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, recipe_id) '
+            f'SELECT ranked.user_id, ranked.feed_recipe_id FROM ({sql}) '
+            'ranked WHERE ranked.row_number <= %s',
+            (*params, settings.FEED_MAX_LENGTH)
+        )
+
+
+def remove_from_feed(user_id, author_id):
+    """Убирает из ленты рецепты автора после отписки."""
+    cache.delete(get_pull_authors_key(user_id))
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
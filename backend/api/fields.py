@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта в виде строки Base64 или файла multipart/form-data.
+
+    Файл из multipart-запроса записывается во временный файл частями,
+    а размер и габариты проверяются по заголовку изображения до его
+    полного декодирования.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            self.validate_image(data)
+            return serializers.ImageField.to_internal_value(self, data)
+        if (
+            isinstance(data, str)
+            and len(data) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE
+        ):
+            self.fail_too_large()
+        image = super().to_internal_value(data)
+        if image is not None:
+            self.validate_image(image)
+        return image
+
+    def fail_too_large(self):
+        raise serializers.ValidationError(
+            'Размер изображения не должен превышать '
+            f'{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ')
+
+    def validate_image(self, file):
+        if file.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail_too_large()
+        file.seek(0)
+        try:
+            width, height = Image.open(file).size
+        except (OSError, Image.DecompressionBombError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            file.seek(0)
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            raise serializers.ValidationError(
+                'Ширина и высота изображения не должны превышать '
+                f'{settings.RECIPE_IMAGE_MAX_DIMENSION} пикселей')
@@ -1,18 +1,28 @@
 from distutils.util import strtobool
 
 import django_filters
-from recipes.models import Favorite, Purchase, Recipe
-from rest_framework import filters
+from django import forms
+from django.db.models import Exists, OuterRef
+from recipes.models import Favorite, Purchase, Recipe, RecipeTag
+
+from .recipe_search import search_recipes
 
 CHOICES = (
     ('0', 'False'),
     ('1', 'True')
 )
 
+ORDERINGS = {
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+}
+
 
 class RecipeFilter(django_filters.FilterSet):
     author = django_filters.CharFilter(field_name='author__id')
-    tags = django_filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = django_filters.Filter(
+        widget=forms.SelectMultiple,
+        method='get_tags'
+    )
     is_favorited = django_filters.TypedChoiceFilter(
         choices=CHOICES,
         coerce=strtobool,
@@ -23,25 +33,42 @@ class RecipeFilter(django_filters.FilterSet):
         coerce=strtobool,
         method='get_is_in_shopping_cart'
     )
+    search = django_filters.CharFilter(method='get_search')
+    ordering = django_filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'search', 'ordering'
+        ]
 
-    def get_is_favorited(self, queryset, name, value):
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value)))
+
+    def filter_by_user_relation(self, queryset, model, value):
         if not value:
             return queryset
-        favorites_pk = Favorite.objects.filter(
-            user=self.request.user).values_list('pk', flat=True)
-        return queryset.filter(favoriterecipe__in=favorites_pk)
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk'))))
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_by_user_relation(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if not value:
-            return queryset
-        purchases_pk = Purchase.objects.filter(
-            user=self.request.user).values_list('pk', flat=True)
-        return queryset.filter(recipeincart__in=purchases_pk)
+        return self.filter_by_user_relation(queryset, Purchase, value)
 
+    def get_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
 
-class IngredientFilter(filters.SearchFilter):
-    search_param = 'name'
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
@@ -0,0 +1,76 @@
+from bisect import bisect_left
+from operator import itemgetter
+
+from recipes.models import Ingredient
+
+from .catalog import get_catalog_version
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска без учета регистра и буквы ё."""
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Отсортированный индекс ингредиентов в памяти процесса.
+
+    Индекс строится одним запросом при первом поиске и сбрасывается
+    сигналами при изменении ингредиентов, поэтому автодополнение
+    не обращается к базе данных. Изменения из других процессов,
+    например массовую загрузку каталога, индекс замечает по версии
+    каталога в общем кэше (Redis), без запроса к базе.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._version = None
+
+    def invalidate(self):
+        self._data = None
+
+    def build(self):
+        self._version = get_catalog_version()
+        entries = sorted((
+            (normalize(name), {
+                'id': pk,
+                'name': name,
+                'measurement_unit': measurement_unit,
+            })
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator()
+        ), key=itemgetter(0))
+        self._data = (
+            [key for key, _ in entries],
+            [ingredient for _, ingredient in entries]
+        )
+        return self._data
+
+    def search(self, name, limit=None):
+        """Возвращает сначала ингредиенты, начинающиеся с name,
+        затем содержащие name в середине названия."""
+        if self._version != get_catalog_version():
+            self.invalidate()
+        keys, ingredients = self._data or self.build()
+        query = normalize(name.strip())
+        if limit is None:
+            limit = len(keys)
+        result = []
+        position = bisect_left(keys, query)
+        while (
+            position < len(keys)
+            and len(result) < limit
+            and keys[position].startswith(query)
+        ):
+            result.append(ingredients[position])
+            position += 1
+        if not query:
+            return result
+        for key, ingredient in zip(keys, ingredients):
+            if len(result) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                result.append(ingredient)
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,59 @@
+import base64
+import json
+import tracemalloc
+from io import BytesIO
+
+from api.fields import RecipeImageField
+from django.core.management import BaseCommand
+from PIL import Image
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+
+class Command(BaseCommand):
+    help = "Compares peak memory of Base64 and multipart image uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', type=int, default=2000,
+            help='Width and height of the uploaded test image')
+
+    def make_image(self, size):
+        buffer = BytesIO()
+        Image.effect_noise((size, size), 64).convert('RGB').save(
+            buffer, 'JPEG', quality=95)
+        buffer.name = 'image.jpg'
+        buffer.seek(0)
+        return buffer
+
+    def measure(self, request):
+        field = RecipeImageField()
+        tracemalloc.start()
+        try:
+            field.run_validation(request.data['image'])
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        image = self.make_image(options['size'])
+        image_size = len(image.getvalue())
+        base64_request = Request(
+            factory.post('/api/recipes/', json.dumps({
+                'image': 'data:image/jpeg;base64,'
+                + base64.b64encode(image.getvalue()).decode()
+            }), content_type='application/json'),
+            parsers=[JSONParser()]
+        )
+        multipart_request = Request(
+            factory.post(
+                '/api/recipes/', {'image': image}, format='multipart'),
+            parsers=[MultiPartParser()]
+        )
+        self.stdout.write(f'Image: {image_size} bytes')
+        for name, request in (
+                ('base64', base64_request), ('multipart', multipart_request)):
+            self.stdout.write(
+                f'{name}: peak {self.measure(request) / 1024:.0f} KiB')
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Measures throughput and latency of the hot API endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Base URL of the running backend')
+        parser.add_argument(
+            '--token', help='Auth token for the favorite toggle requests')
+        parser.add_argument(
+            '--recipe', type=int, default=1,
+            help='Recipe id used for the favorite toggle requests')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Number of requests per scenario')
+        parser.add_argument(
+            '--concurrency', type=int, default=20,
+            help='Number of concurrent clients')
+
+    def send(self, method, url, token):
+        request = Request(url, method=method)
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+        started = perf_counter()
+        try:
+            with urlopen(request) as response:
+                response.read()
+        except HTTPError as error:
+            error.read()
+        return perf_counter() - started
+
+    def run_scenario(self, name, requests, concurrency):
+        started = perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            timings = list(executor.map(lambda args: self.send(*args),
+                                        requests))
+        elapsed = perf_counter() - started
+        percentiles = quantiles(timings, n=100)
+        self.stdout.write(
+            f'{name}: {len(timings) / elapsed:.0f} rps, '
+            f'p50 {percentiles[49] * 1000:.0f} ms, '
+            f'p95 {percentiles[94] * 1000:.0f} ms'
+        )
+
+    def handle(self, *args, **options):
+        base_url = options['url'].rstrip('/')
+        token, count = options['token'], options['requests']
+        self.run_scenario('recipe list', [
+            ('GET', f'{base_url}/api/recipes/?page=1', token)
+        ] * count, options['concurrency'])
+        if not token:
+            return
+        favorite_url = f'{base_url}/api/recipes/{options["recipe"]}/favorite/'
+        self.run_scenario('favorite toggle', [
+            (method, favorite_url, token)
+            for _ in range(count // 2) for method in ('POST', 'DELETE')
+        ], options['concurrency'])
@@ -0,0 +1,76 @@
+import random
+from time import perf_counter
+
+from api.recipe_search import recipe_search_index, search_recipes
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from recipes.models import Recipe
+from recipes.search import update_search_vectors
+from users.models import User
+
+WORDS = [
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'котлеты', 'капуста', 'свекла',
+    'морковь', 'картофель', 'курица', 'говядина', 'грибы', 'сметана', 'сыр',
+    'яблоки', 'тесто', 'лук', 'чеснок', 'укроп', 'запеченный', 'тушеный',
+    'жареный', 'свежий', 'домашний', 'быстрый', 'праздничный', 'постный',
+]
+QUERIES = ['борщ', 'капусту', 'курица грибы', 'домашний пирог с яблоками']
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Measures recipe search latency on a generated dataset"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100000,
+            help='Number of generated recipes')
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help='Number of runs per query')
+
+    def measure(self, queryset):
+        started = perf_counter()
+        list(queryset[:6])
+        return perf_counter() - started
+
+    def report(self, name, queryset_factory, repeat):
+        for query in QUERIES:
+            elapsed = sum(
+                self.measure(queryset_factory(query))
+                for _ in range(repeat)) / repeat
+            self.stdout.write(f'{name} "{query}": {elapsed * 1000:.1f} ms')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.generate(options['recipes'])
+            self.stdout.write(f'Recipes: {Recipe.objects.count()}')
+            self.report('icontains', lambda query: Recipe.objects.filter(
+                Q(name__icontains=query) | Q(text__icontains=query)
+            ), options['repeat'])
+            recipe_search_index.invalidate()
+            started = perf_counter()
+            recipe_search_index.build()
+            self.stdout.write(
+                f'index build: {(perf_counter() - started) * 1000:.0f} ms')
+            self.report('search', lambda query: search_recipes(
+                Recipe.objects.all(), query), options['repeat'])
+            transaction.set_rollback(True)
+        recipe_search_index.invalidate()
+
+    def generate(self, count):
+        author = User.objects.create(
+            username='search_benchmark', email='search_benchmark@example.com')
+        generator = random.Random(0)
+        for start in range(0, count, BATCH_SIZE):
+            Recipe.objects.bulk_create([
+                Recipe(
+                    name=' '.join(generator.sample(WORDS, 3)).capitalize(),
+                    text=' '.join(generator.choices(WORDS, k=30)),
+                    cooking_time=generator.randint(1, 180),
+                    author=author,
+                )
+                for _ in range(min(BATCH_SIZE, count - start))
+            ])
+        update_search_vectors(Recipe.objects.all())
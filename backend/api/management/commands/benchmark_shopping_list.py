@@ -0,0 +1,36 @@
+from io import BytesIO
+from time import perf_counter
+
+from api.shopping_list import register_font, render_shopping_list
+from django.core.management import BaseCommand
+
+CART_SIZES = [10, 100, 1000]
+
+
+class Command(BaseCommand):
+    help = "Measures shopping list PDF rendering time and size"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', type=int, default=CART_SIZES,
+            help='Number of ingredients in the rendered carts')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of renders per cart size')
+
+    def handle(self, *args, **options):
+        register_font()
+        for size in options['sizes']:
+            shopping_list = [{
+                'ingredient__name': f'ингредиент номер {number}',
+                'ingredient__measurement_unit': 'г',
+                'ingredient_total': number * 10,
+            } for number in range(size)]
+            started = perf_counter()
+            for _ in range(options['repeat']):
+                output = render_shopping_list(shopping_list, BytesIO())
+            elapsed = (perf_counter() - started) / options['repeat']
+            self.stdout.write(
+                f'{size} ingredients: {elapsed * 1000:.1f} ms, '
+                f'{len(output.getvalue())} bytes'
+            )
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from pathlib import PurePosixPath
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+from recipes.models import Recipe
+from recipes.storage import content_addressed_storage
+
+IMAGES_DIR = 'recipes/images'
+
+
+class Command(BaseCommand):
+    help = "Deletes recipe images that are not referenced by any recipe"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help='Keep unreferenced files younger than this')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report files that would be deleted')
+
+    def walk(self, directory):
+        directories, files = content_addressed_storage.listdir(directory)
+        for name in files:
+            yield str(PurePosixPath(directory) / name)
+        for name in directories:
+            yield from self.walk(str(PurePosixPath(directory) / name))
+
+    def get_references(self):
+        references = {}
+        for image, variants in Recipe.objects.values_list(
+                'image', 'image_variants').iterator():
+            names = [image] + [
+                name for files in variants.values() for name in files.values()
+            ]
+            for name in names:
+                references[name] = references.get(name, 0) + 1
+        return references
+
+    def handle(self, *args, **options):
+        if not content_addressed_storage.exists(IMAGES_DIR):
+            return
+        references = self.get_references()
+        threshold = timezone.now() - timedelta(hours=options['grace_hours'])
+        deleted = 0
+        for name in self.walk(IMAGES_DIR):
+            if references.get(name):
+                continue
+            if content_addressed_storage.get_modified_time(name) > threshold:
+                continue
+            if not options['dry_run']:
+                content_addressed_storage.delete(name)
+            deleted += 1
+        self.stdout.write(f'Unreferenced files removed: {deleted}')
@@ -0,0 +1,226 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.utils import timezone
+from recipes.models import (Favorite, Ingredient, Purchase, Recipe,
+                            RecipeIngredient, RecipeTag, Tag)
+from recipes.search import update_search_vectors
+from users.models import Subscription, User
+
+ADJECTIVES = [
+    'домашний', 'быстрый', 'праздничный', 'постный', 'деревенский',
+    'запеченный', 'тушеный', 'жареный', 'легкий', 'сытный', 'острый',
+]
+DISHES = [
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'рагу', 'плов', 'омлет',
+    'запеканка', 'котлеты', 'блины', 'сырники', 'паста', 'жаркое',
+]
+STEPS = [
+    'Нарезать овощи.', 'Обжарить на среднем огне.', 'Добавить специи.',
+    'Тушить под крышкой.', 'Посолить по вкусу.', 'Подавать горячим.',
+    'Перемешать и оставить на десять минут.',
+    'Запекать до золотистой корочки.',
+]
+TAGS = [
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+]
+PASSWORD = 'synthetic-password'
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса закона Ципфа для элементов в порядке популярности."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = "Generates a seeded synthetic dataset for load and scale testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument(
+            '--authors', type=float, default=0.2,
+            help='Share of users who publish recipes')
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Recipes are published evenly over this many last days')
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Zipf exponent of recipes per author and of popularity')
+        parser.add_argument(
+            '--ingredients', type=int, nargs=2, default=[3, 12],
+            metavar=('MIN', 'MAX'), help='Ingredients per recipe')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Average favorites per user')
+        parser.add_argument(
+            '--purchases', type=int, default=5,
+            help='Average recipes in a shopping cart per user')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Average subscriptions per user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help='Prefix of generated usernames and emails')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True))
+        if len(self.ingredient_ids) < options['ingredients'][1]:
+            raise CommandError(
+                'В каталоге мало ингредиентов, выполните load_ingredients')
+        self.tag_ids = self.get_tag_ids()
+        started = perf_counter()
+        user_ids = self.timed('users', self.create_users, options)
+        authors_count = max(1, int(len(user_ids) * options['authors']))
+        author_ids = self.random.sample(user_ids, authors_count)
+        recipe_ids = self.timed(
+            'recipes', self.create_recipes, author_ids, options)
+        self.timed(
+            'favorites', self.create_relations, Favorite, 'recipe_id',
+            user_ids, recipe_ids, options['favorites'], options['zipf'])
+        self.timed(
+            'purchases', self.create_relations, Purchase, 'recipe_id',
+            user_ids, recipe_ids, options['purchases'], options['zipf'])
+        self.timed(
+            'subscriptions', self.create_relations, Subscription,
+            'author_id', user_ids, author_ids, options['subscriptions'],
+            options['zipf'])
+        self.timed('derived data', self.rebuild_derived_data)
+        self.stdout.write(f'Done in {perf_counter() - started:.1f} s')
+
+    def timed(self, name, function, *args):
+        started = perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.stdout.write(f'{name}: {perf_counter() - started:.1f} s')
+
+    def get_tag_ids(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create([
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            ])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, options):
+        prefix = options['prefix']
+        offset = User.objects.filter(username__startswith=prefix).count()
+        password = make_password(PASSWORD)
+        user_ids = []
+        for start in range(0, options['users'], self.batch_size):
+            users = User.objects.bulk_create([
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(
+                    offset + start,
+                    offset + min(start + self.batch_size, options['users']))
+            ])
+            user_ids += [user.id for user in users]
+        return user_ids
+
+    def create_recipes(self, author_ids, options):
+        """Создает рецепты пачками вместе с их ингредиентами и тегами.
+
+        Число рецептов у авторов распределено по закону Ципфа:
+        немногие авторы публикуют большую часть рецептов. Дата
+        публикации растет вместе с id и равномерно покрывает последние
+        --days дней; auto_now_add не дает задать ее в bulk_create,
+        поэтому она проставляется отдельным bulk_update.
+        """
+        weights = zipf_weights(len(author_ids), options['zipf'])
+        min_ingredients, max_ingredients = options['ingredients']
+        interval = timedelta(days=options['days']) / max(1, options['recipes'])
+        first_date = timezone.now() - timedelta(days=options['days'])
+        recipe_ids = []
+        for start in range(0, options['recipes'], self.batch_size):
+            count = min(self.batch_size, options['recipes'] - start)
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    author_id=author_id,
+                    name=(
+                        f'{self.random.choice(ADJECTIVES).capitalize()} '
+                        f'{self.random.choice(DISHES)}'
+                    ),
+                    text=' '.join(self.random.choices(STEPS, k=4)),
+                    cooking_time=self.random.randint(5, 180),
+                )
+                for author_id in self.random.choices(
+                    author_ids, cum_weights=weights, k=count)
+            ])
+            for number, recipe in enumerate(recipes, start):
+                recipe.pub_date = first_date + interval * (
+                    number + self.random.random())
+            Recipe.objects.bulk_update(
+                recipes, ['pub_date'], batch_size=self.batch_size)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient_id in self.random.sample(
+                    self.ingredient_ids,
+                    self.random.randint(min_ingredients, max_ingredients))
+            ], batch_size=self.batch_size)
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipe_id=recipe.id, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in self.random.sample(
+                    self.tag_ids,
+                    self.random.randint(1, len(self.tag_ids)))
+            ], batch_size=self.batch_size)
+            recipe_ids += [recipe.id for recipe in recipes]
+        return recipe_ids
+
+    def create_relations(self, model, field, user_ids, target_ids,
+                         average, exponent):
+        """Связывает пользователей с рецептами или авторами.
+
+        Популярность целей распределена по закону Ципфа, число связей
+        у пользователя — равномерно от 0 до удвоенного среднего.
+        """
+        if not target_ids or not average:
+            return
+        targets = target_ids[:]
+        self.random.shuffle(targets)
+        weights = zipf_weights(len(targets), exponent)
+        batch = []
+        for user_id in user_ids:
+            count = min(self.random.randint(0, 2 * average), len(targets))
+            chosen = set(self.random.choices(
+                targets, cum_weights=weights, k=count))
+            chosen.discard(user_id if field == 'author_id' else None)
+            batch += [
+                model(user_id=user_id, **{field: target_id})
+                for target_id in chosen
+            ]
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def rebuild_derived_data(self):
+        """Заполняет данные, которые bulk_create не обновляет сигналами."""
+        update_search_vectors(Recipe.objects.all())
+        call_command('rebuild_cart_ingredients', stdout=self.stdout)
+        call_command('reconcile_recipe_counters', stdout=self.stdout)
+        call_command('rebuild_feed', stdout=self.stdout)
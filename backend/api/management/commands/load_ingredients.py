@@ -1,33 +1,118 @@
 import csv
+import json
+from itertools import islice
 from pathlib import Path
-from backend.settings import BASE_DIR
-
-from django.contrib.auth import get_user_model
-from django.core.management import BaseCommand
+from time import perf_counter
 
+from api.catalog import bump_catalog_version
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
 from recipes.models import Ingredient
 
-User = get_user_model()
+DEFAULT_FILE = Path(settings.BASE_DIR) / 'data' / 'ingredients.csv'
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield row[:2] if len(row) >= 2 else None
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по одному, не загружая файл целиком.
 
-PROJECT_DIR = Path(BASE_DIR).resolve().joinpath('data')
-FILE_TO_OPEN = PROJECT_DIR / 'ingredients.csv'
+    Подходит и для JSON Lines: объекты могут разделяться переводом строки.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise CommandError('Некорректный JSON в конце файла')
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if isinstance(item, dict):
+            yield [item.get('name'), item.get('measurement_unit')]
+        else:
+            yield None
 
 
 class Command(BaseCommand):
-    help = "Loads data from ingredients.csv"
+    help = "Loads ingredients from a CSV or JSON file, skipping existing ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(DEFAULT_FILE),
+            help='CSV (name,measurement_unit) or JSON file')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of rows checked and inserted per query')
+
+    def clean(self, row):
+        if row is None:
+            return None
+        name, measurement_unit = (
+            str(value or '').strip() for value in row)
+        if (not name or not measurement_unit
+                or len(name) > NAME_MAX_LENGTH
+                or len(measurement_unit) > UNIT_MAX_LENGTH):
+            return None
+        return name, measurement_unit
+
+    def load_batch(self, rows):
+        """Вставляет ингредиенты пачки, которых еще нет в базе.
+
+        Существующие пары (name, measurement_unit) находятся одним
+        запросом, а гонку с параллельной загрузкой закрывает
+        уникальное ограничение.
+        """
+        keys = set(rows)
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit'))
+        new = sorted(keys - existing)
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in new
+        ], ignore_conflicts=True)
+        return len(new)
 
     def handle(self, *args, **options):
-        with open(
-            FILE_TO_OPEN,
-            'r',
-            encoding='utf-8'
-        ) as csvfile:
-            order = ['name', 'measurement_unit']
-            data_reader = csv.DictReader(
-                csvfile,
-                fieldnames=order,
-                delimiter=',')
-            Ingredient.objects.bulk_create([Ingredient(
-                name=row['name'],
-                measurement_unit=row['measurement_unit']
-            ) for row in data_reader])
+        path = Path(options['path'])
+        if path.suffix not in ('.csv', '.json', '.jsonl'):
+            raise CommandError('Поддерживаются только файлы CSV и JSON')
+        reader = read_csv if path.suffix == '.csv' else read_json
+        counts = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        started = perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = reader(file)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                cleaned = [self.clean(row) for row in batch]
+                valid = [row for row in cleaned if row is not None]
+                inserted = self.load_batch(valid)
+                counts['inserted'] += inserted
+                counts['skipped'] += len(valid) - inserted
+                counts['invalid'] += len(batch) - len(valid)
+        if counts['inserted']:
+            bump_catalog_version()
+        elapsed = perf_counter() - started
+        total = sum(counts.values())
+        self.stdout.write(
+            f'Inserted {counts["inserted"]}, skipped {counts["skipped"]}, '
+            f'invalid {counts["invalid"]} of {total} rows '
+            f'in {elapsed:.1f} s ({total / max(elapsed, 1e-9):.0f} rows/s)'
+        )
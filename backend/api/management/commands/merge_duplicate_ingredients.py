@@ -0,0 +1,109 @@
+from api.catalog import bump_catalog_version
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from recipes.models import CartIngredient, Ingredient, RecipeIngredient
+
+CONSTRAINT_NAME = 'unique_ingredient'
+
+
+class Command(BaseCommand):
+    help = ("Merges ingredients with the same name and measurement unit "
+            "and adds the unique constraint")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report duplicates that would be merged')
+
+    def get_survivors(self):
+        """Сопоставляет id дублей с id ингредиента, который останется.
+
+        Остается ингредиент с наименьшим id в каждой паре
+        (name, measurement_unit).
+        """
+        groups = Ingredient.objects.values(
+            'name', 'measurement_unit'
+        ).annotate(
+            count=Count('id'), survivor_id=Min('id')
+        ).filter(count__gt=1).order_by()
+        survivors = {}
+        for group in groups:
+            for ingredient_id in Ingredient.objects.filter(
+                    name=group['name'],
+                    measurement_unit=group['measurement_unit']
+            ).exclude(id=group['survivor_id']).values_list('id', flat=True):
+                survivors[ingredient_id] = group['survivor_id']
+        return survivors
+
+    def repoint(self, model, owner_field, survivors):
+        """Переносит строки model с дублей на оставшийся ингредиент.
+
+        Строки одного владельца (рецепта или списка покупок), которые
+        после переноса указывают на один ингредиент, сливаются в одну
+        с суммарным количеством. Возвращает число удаленных строк.
+        """
+        rows, changed, to_delete = {}, set(), set()
+        for row in model.objects.filter(
+                ingredient_id__in={*survivors, *survivors.values()}
+        ).order_by('id'):
+            ingredient_id = survivors.get(row.ingredient_id, row.ingredient_id)
+            key = (getattr(row, owner_field), ingredient_id)
+            kept = rows.get(key)
+            if kept is None:
+                rows[key] = row
+            elif row.ingredient_id == ingredient_id:
+                row.amount += kept.amount
+                to_delete.add(kept.id)
+                rows[key] = row
+            else:
+                kept.amount += row.amount
+                to_delete.add(row.id)
+            target = rows[key]
+            if kept is not None or target.ingredient_id != ingredient_id:
+                target.ingredient_id = ingredient_id
+                changed.add(key)
+        model.objects.filter(id__in=to_delete).delete()
+        model.objects.bulk_update(
+            [rows[key] for key in changed], ['ingredient', 'amount'],
+            batch_size=1000)
+        return len(to_delete)
+
+    def add_constraint(self):
+        """Добавляет уникальное ограничение, если его еще нет в таблице."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Ingredient._meta.db_table)
+        if CONSTRAINT_NAME in constraints:
+            return False
+        constraint, = (
+            constraint for constraint in Ingredient._meta.constraints
+            if constraint.name == CONSTRAINT_NAME
+        )
+        with connection.schema_editor() as editor:
+            editor.add_constraint(Ingredient, constraint)
+        return True
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            survivors = self.get_survivors()
+            if options['dry_run']:
+                self.stdout.write(f'Duplicate ingredients: {len(survivors)}')
+                return
+            merged = {
+                model.__name__: self.repoint(model, owner_field, survivors)
+                for model, owner_field in (
+                    (RecipeIngredient, 'recipe_id'),
+                    (CartIngredient, 'user_id'),
+                )
+            }
+            Ingredient.objects.filter(id__in=survivors).delete()
+        added = self.add_constraint()
+        if survivors:
+            bump_catalog_version()
+        self.stdout.write(
+            f'Merged {len(survivors)} duplicate ingredients, '
+            f'recipe rows merged: {merged["RecipeIngredient"]}, '
+            f'cart rows merged: {merged["CartIngredient"]}, '
+            f'constraint {"added" if added else "already present"}'
+        )
@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import CartIngredient, RecipeIngredient
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Rebuilds shopping cart totals from purchases"
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        CartIngredient.objects.all().delete()
+        totals = RecipeIngredient.objects.filter(
+            recipe__recipeincart__isnull=False
+        ).values('recipe__recipeincart__user', 'ingredient').annotate(
+            total=Sum('amount')
+        ).order_by().iterator()
+        batch, count = [], 0
+        for row in totals:
+            batch.append(CartIngredient(
+                user_id=row['recipe__recipeincart__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total']
+            ))
+            if len(batch) == BATCH_SIZE:
+                CartIngredient.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        CartIngredient.objects.bulk_create(batch)
+        count += len(batch)
+        self.stdout.write(f'Rebuilt {count} shopping cart rows')
@@ -0,0 +1,28 @@
+from api.feed import rebuild_feeds
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.models import FeedEntry
+from users.models import Subscription
+
+
+class Command(BaseCommand):
+    help = "Rebuilds subscription feeds from existing subscriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Subscribers whose feeds are rebuilt in one statement')
+
+    def handle(self, *args, **options):
+        user_ids = list(Subscription.objects.values_list(
+            'user_id', flat=True).order_by('user_id').distinct())
+        batch_size = options['batch_size']
+        FeedEntry.objects.exclude(
+            user_id__in=Subscription.objects.values('user_id')).delete()
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic():
+                rebuild_feeds(user_ids[start:start + batch_size])
+        self.stdout.write(
+            f'Rebuilt feeds of {len(user_ids)} users, '
+            f'{FeedEntry.objects.count()} entries'
+        )
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Purchase, Recipe
+
+
+def count_by_recipe(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).values(
+            'recipe').annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = "Recounts recipe favorites and shopping cart counters"
+
+    def handle(self, *args, **options):
+        favorites_count = count_by_recipe(Favorite)
+        in_carts_count = count_by_recipe(Purchase)
+        updated = Recipe.objects.annotate(
+            actual_favorites_count=favorites_count,
+            actual_in_carts_count=in_carts_count,
+        ).filter(
+            ~Q(favorites_count=F('actual_favorites_count'))
+            | ~Q(in_carts_count=F('actual_in_carts_count'))
+        ).update(
+            favorites_count=favorites_count,
+            in_carts_count=in_carts_count,
+        )
+        self.stdout.write(f'Fixed counters of {updated} recipes')
@@ -0,0 +1,20 @@
+from concurrent.futures import wait
+
+from django.core.management import BaseCommand
+from recipes.images import build_image_variants, executor, get_missing_variants
+
+
+class Command(BaseCommand):
+    help = "Builds image variants of recipes whose processing was lost"
+
+    def handle(self, *args, **options):
+        futures = [
+            executor.submit(build_image_variants, recipe_id, name)
+            for recipe_id, name in get_missing_variants().values_list(
+                'id', 'image').iterator()
+        ]
+        wait(futures)
+        self.stdout.write(
+            f'Requeued images: {len(futures)}, '
+            f'still without variants: {get_missing_variants().count()}'
+        )
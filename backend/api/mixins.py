@@ -1,5 +1,7 @@
 from rest_framework import mixins, viewsets
 
+from .catalog import cached_catalog_response
+
 
 class CreateDestroyViewSet(mixins.CreateModelMixin,
                            mixins.DestroyModelMixin,
@@ -11,3 +13,13 @@ class ListRetrieveViewSet(mixins.ListModelMixin,
                           mixins.RetrieveModelMixin,
                           viewsets.GenericViewSet):
     pass
+
+
+class CatalogCacheMixin:
+    """Кэширует отрендеренный список справочника до его изменения."""
+
+    def list(self, request, *args, **kwargs):
+        return cached_catalog_response(
+            request, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs)
+        )
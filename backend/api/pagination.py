@@ -1,4 +1,13 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class PageLimitPagination(PageNumberPagination):
@@ -8,3 +17,154 @@ class PageLimitPagination(PageNumberPagination):
 
 class RecipesLimitPagination(PageNumberPagination):
     page_size_query_param = 'recipes_limit'
+
+
+class RecipePagination(PageLimitPagination):
+    """Пагинация рецептов с курсорным режимом.
+
+    С параметром cursor страницы выбираются по ключу из полей порядка,
+    по умолчанию (pub_date, id), без OFFSET и без подсчета общего числа
+    рецептов. Параметр count=0 отключает подсчет и при обычной
+    постраничной пагинации.
+    """
+    cursor_query_param = 'cursor'
+    cursor_only = False
+    count_query_param = 'count'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = None
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        ordering = self.get_ordering(queryset)
+        self.ordering_fields = [field.lstrip('-') for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        self.mode = self.get_mode(request)
+        if self.mode == 'cursor':
+            return self.paginate_by_cursor(queryset, page_size)
+        if self.mode == 'no_count':
+            return self.paginate_without_count(queryset, page_size)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_mode(self, request):
+        """Режим пагинации: cursor, no_count или None для обычного."""
+        if (self.cursor_only
+                or self.cursor_query_param in request.query_params):
+            return 'cursor'
+        if request.query_params.get(self.count_query_param) in ('0', 'false'):
+            return 'no_count'
+        return None
+
+    def get_ordering(self, queryset):
+        """Порядок, заданный фильтром ordering, или порядок по умолчанию.
+
+        Все поля порядка сортируются по убыванию, последнее из них — id.
+        """
+        return tuple(queryset.query.order_by) or self.ordering
+
+    def paginate_by_cursor(self, queryset, page_size):
+        position = self.decode_cursor(
+            self.request.query_params.get(self.cursor_query_param),
+            queryset
+        )
+        if position is not None:
+            condition = Q()
+            for index, field in enumerate(self.ordering_fields):
+                condition |= Q(
+                    **dict(zip(self.ordering_fields[:index], position)),
+                    **{f'{field}__lt': position[index]}
+                )
+            queryset = queryset.filter(condition)
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_position = [
+            getattr(results[-1], field) for field in self.ordering_fields
+        ] if self.has_next else None
+        return results
+
+    def paginate_without_count(self, queryset, page_size):
+        page_number = self.request.query_params.get(self.page_query_param, 1)
+        try:
+            page_number = int(page_number)
+        except (TypeError, ValueError):
+            page_number = 0
+        if page_number < 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='Неверный номер страницы.'))
+        offset = (page_number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page_number = page_number
+        return results[:page_size]
+
+    def encode_cursor(self, position):
+        return urlsafe_b64encode('|'.join(
+            value.isoformat() if isinstance(value, datetime) else str(value)
+            for value in position
+        ).encode()).decode()
+
+    def get_cursor_field(self, queryset, name):
+        """Поле модели или аннотации, например rank при поиске."""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def decode_cursor(self, cursor, queryset):
+        if not cursor:
+            return None
+        try:
+            values = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            if len(values) != len(self.ordering_fields):
+                raise NotFound(self.invalid_cursor_message)
+            return [
+                self.get_cursor_field(queryset, field).to_python(value)
+                for field, value in zip(self.ordering_fields, values)
+            ]
+        except (BinasciiError, UnicodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.mode is None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.mode == 'cursor':
+            return replace_query_param(
+                url, self.cursor_query_param,
+                self.encode_cursor(self.next_position))
+        return replace_query_param(
+            url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.mode is None:
+            return super().get_previous_link()
+        if self.mode == 'cursor' or self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.mode is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class FeedPagination(RecipePagination):
+    """Лента подписок листается только курсором.
+
+    Новые рецепты добавляются в начало ленты, и номера страниц
+    при этом сдвигались бы.
+    """
+    cursor_only = True
@@ -0,0 +1,138 @@
+import re
+from collections import Counter, defaultdict
+from heapq import nlargest
+from math import log
+from operator import itemgetter
+
+from django.db import connections
+from django.db.models import Case, F, FloatField, Value, When
+from recipes.models import Recipe
+from recipes.search import SEARCH_CONFIG
+
+from .catalog import get_version
+from .facets import RECIPES_VERSION_KEY
+from .ingredient_index import normalize
+
+WORD_RE = re.compile(r'\w+')
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'иях', 'ией', 'ием', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой',
+    'ей', 'ых', 'их', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ью',
+    'ия', 'ье', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+STOP_WORDS = {
+    'а', 'в', 'во', 'и', 'из', 'или', 'к', 'на', 'не', 'но', 'о', 'от',
+    'по', 'с', 'со', 'у',
+}
+MIN_STEM_LENGTH = 3
+NAME_WEIGHT = 2
+TEXT_WEIGHT = 1
+FALLBACK_RESULTS_LIMIT = 1000
+
+
+def stem(word):
+    """Упрощенный стемминг: отбрасывает типичное окончание слова."""
+    for ending in ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [
+        stem(word) for word in WORD_RE.findall(normalize(text))
+        if word not in STOP_WORDS
+    ]
+
+
+class RecipeSearchIndex:
+    """Обратный индекс рецептов в памяти процесса.
+
+    Используется вместо tsvector, когда база данных не PostgreSQL,
+    например в тестах на SQLite. Строится одним запросом при первом
+    поиске и сбрасывается сигналами при изменении рецептов, а изменения
+    из других процессов замечает по версии рецептов в кэше.
+    """
+
+    def __init__(self):
+        self._postings = None
+        self._documents_count = 0
+        self._version = None
+
+    def invalidate(self):
+        self._postings = None
+
+    def build(self):
+        self._version = get_version(RECIPES_VERSION_KEY)
+        postings = defaultdict(Counter)
+        documents_count = 0
+        for pk, name, text in Recipe.objects.values_list(
+                'id', 'name', 'text').iterator():
+            documents_count += 1
+            for token in tokenize(name):
+                postings[token][pk] += NAME_WEIGHT
+            for token in tokenize(text):
+                postings[token][pk] += TEXT_WEIGHT
+        self._postings = postings
+        self._documents_count = documents_count
+        return postings
+
+    def search(self, query):
+        """Возвращает релевантность рецептов, содержащих все слова запроса.
+
+        Вес слова в рецепте умножается на его редкость (idf).
+        """
+        postings = self._postings
+        if postings is None or self._version != get_version(
+                RECIPES_VERSION_KEY):
+            postings = self.build()
+        tokens = set(tokenize(query))
+        if not tokens or any(token not in postings for token in tokens):
+            return {}
+        ranked = None
+        for token in tokens:
+            counts = postings[token]
+            idf = log(self._documents_count / len(counts)) + 1
+            scores = {pk: weight * idf for pk, weight in counts.items()}
+            if ranked is None:
+                ranked = scores
+            else:
+                ranked = {
+                    pk: score + scores[pk]
+                    for pk, score in ranked.items() if pk in scores
+                }
+        return ranked
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по запросу и сортирует их по релевантности rank.
+
+    В PostgreSQL используется колонка search_vector с GIN-индексом
+    и русским стеммингом, в остальных СУБД — индекс в памяти,
+    из которого берутся FALLBACK_RESULTS_LIMIT лучших рецептов.
+    """
+    ordering = ('-rank', '-pub_date', '-id')
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector__match=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by(*ordering)
+    scores = nlargest(
+        FALLBACK_RESULTS_LIMIT,
+        recipe_search_index.search(query).items(),
+        key=itemgetter(1)
+    )
+    if not scores:
+        return queryset.none()
+    return queryset.filter(pk__in=[pk for pk, _ in scores]).annotate(
+        rank=Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in scores],
+            output_field=FloatField()
+        )
+    ).order_by(*ordering)
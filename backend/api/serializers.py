@@ -1,10 +1,32 @@
+from django.conf import settings
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
+from recipes.images import schedule_image_variants
 from recipes.models import (Favorite, Ingredient, Purchase, Recipe,
-                            RecipeIngredient, Tag)
+                            RecipeIngredient, RecipeTag, Tag)
+from recipes.storage import content_addressed_storage
 from rest_framework import serializers
 from users.models import Subscription, User
 
-from .utils import func_subscribed
+from .fields import RecipeImageField
+from .utils import (func_subscribed, get_latest_recipes, get_recipes_limit,
+                    update_carts_with_recipe)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, files in value.items():
+            urls[variant] = {}
+            for extension, name in files.items():
+                url = content_addressed_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[variant][extension] = url
+        return urls
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -31,6 +53,17 @@ class RecipeIngredientShortSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = ['id', 'amount']
 
+    def to_representation(self, instance):
+        return {'id': instance.ingredient_id, 'amount': instance.amount}
+
+
+class TagIdsField(serializers.ListField):
+    """Id тегов рецепта, которые проверяются одним запросом к БД."""
+    child = serializers.IntegerField()
+
+    def to_representation(self, value):
+        return [tag.id for tag in value.all()]
+
 
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
@@ -61,6 +94,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     author = UserSerializer()
     image = Base64ImageField(allow_null=True)
+    image_variants = ImageVariantsField()
     ingredients = RecipeIngredientSerializer(
         many=True, source='recipe_ingredient')
     is_favorited = serializers.SerializerMethodField()
@@ -69,10 +103,17 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ['id', 'author', 'ingredients', 'tags',
-                  'image', 'name', 'text', 'cooking_time',
+                  'image', 'image_variants', 'name', 'text', 'cooking_time',
                   'is_favorited', 'is_in_shopping_cart']
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -82,6 +123,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -92,9 +135,11 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_variants', 'cooking_time']
 
 
 class PuchaseSerializer(serializers.ModelSerializer):
@@ -128,23 +173,39 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return func_subscribed(self, obj)
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
+        return func_subscribed(self, obj.author)
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj.author).count()
 
     def get_recipes(self, obj):
-        try:
-            recipes_limit = int(
-                self.context.get('request').query_params['recipes_limit']
+        latest_recipes = self.context.get('latest_recipes')
+        if latest_recipes is None:
+            latest_recipes = get_latest_recipes(
+                [obj.author_id],
+                get_recipes_limit(self.context.get('request'))
             )
-            recipes = Recipe.objects.filter(author=obj.author)[:recipes_limit]
-        except Exception:
-            recipes = Recipe.objects.filter(author=obj.author)
-        serializer = RecipeShortSerializer(recipes, many=True,)
+        serializer = RecipeShortSerializer(
+            latest_recipes.get(obj.author_id, []), many=True)
         return serializer.data
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для массового добавления в избранное, покупки и подписки."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_IDS_LIMIT
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -157,15 +218,12 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault()
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = TagIdsField()
     ingredients = RecipeIngredientShortSerializer(
         source='recipe_ingredient',
         many=True
     )
-    image = Base64ImageField()
+    image = RecipeImageField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -176,6 +234,8 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                   'is_favorited', 'is_in_shopping_cart']
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         current_user = self.context['request'].user
         if Favorite.objects.filter(
                 user=current_user,
@@ -184,6 +244,8 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         current_user = self.context['request'].user
         if Purchase.objects.filter(
                 user=current_user,
@@ -196,26 +258,26 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 'tags': 'Необходимо указать как минимум один тег'
             })
-        tags_set = set()
-        for tag in tags:
-            tags_set.add(tag)
+        tags_set = set(Tag.objects.filter(id__in=tags))
+        if len(tags_set) != len(set(tags)):
+            raise serializers.ValidationError('Тега нет в базе')
         return tags_set
 
     def validate_ingredients(self, ingredients):
-        ingredients_list = []
-        for ingredient in ingredients:
-            if not ingredients:
-                raise serializers.ValidationError({
-                    'ingredients': 'Укажите хотя бы один ингредиент'
-                })
-            if not ingredient['ingredient']['id']:
-                raise serializers.ValidationError(
-                    'Ингредиента нет в базе')
-            if ingredient in ingredients_list:
-                raise serializers.ValidationError(
-                    'Продукты не могут повторяться')
-            ingredients_list.append(ingredient)
-        return ingredients_list
+        if not ingredients:
+            raise serializers.ValidationError({
+                'ingredients': 'Укажите хотя бы один ингредиент'
+            })
+        ingredient_ids = [
+            ingredient['ingredient']['id'] for ingredient in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Продукты не могут повторяться')
+        if Ingredient.objects.filter(
+                id__in=ingredient_ids).count() != len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Ингредиента нет в базе')
+        return ingredients
 
     def add_ingredients(self, ingredients, recipe):
         RecipeIngredient.objects.bulk_create([RecipeIngredient(
@@ -226,20 +288,99 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return recipe
 
     def add_tags(self, tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
-
+        RecipeTag.objects.bulk_create([
+            RecipeTag(tag=tag, recipe=recipe) for tag in tags])
+
+    def update_tags(self, tags, recipe):
+        """Удаляет и добавляет только изменившиеся теги рецепта."""
+        old_ids = set(RecipeTag.objects.filter(
+            recipe=recipe).values_list('tag_id', flat=True))
+        new_ids = {tag.id for tag in tags}
+        if old_ids - new_ids:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=old_ids - new_ids).delete()
+        if new_ids - old_ids:
+            RecipeTag.objects.bulk_create([
+                RecipeTag(tag_id=tag_id, recipe=recipe)
+                for tag_id in new_ids - old_ids
+            ])
+
+    def update_ingredients(self, ingredients, recipe):
+        """Применяет к составу рецепта только отличия от сохраненного.
+
+        Возвращает изменения количества по id ингредиента.
+        """
+        old = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe)
+        }
+        new = {
+            ingredient['ingredient']['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in old.items()
+        }
+        to_create, to_update = [], []
+        for ingredient_id, amount in new.items():
+            recipe_ingredient = old.get(ingredient_id)
+            if recipe_ingredient is None:
+                to_create.append(RecipeIngredient(
+                    ingredient_id=ingredient_id, recipe=recipe, amount=amount))
+            elif recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        to_delete = [
+            recipe_ingredient.pk
+            for ingredient_id, recipe_ingredient in old.items()
+            if ingredient_id not in new
+        ]
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        return {
+            ingredient_id: new.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+            for ingredient_id in old_amounts.keys() | new.keys()
+        }
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredient')
         recipe = Recipe.objects.create(**validated_data)
         self.add_tags(tags, recipe)
         self.add_ingredients(ingredients, recipe)
+        schedule_image_variants(recipe)
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.add_tags(validated_data.pop('tags'), instance)
-        self.add_ingredients(validated_data.pop('recipe_ingredient'), instance)
-        return super().update(instance, validated_data)
+        """Сохраняет только изменившиеся поля рецепта.
+
+        Если ни одно поле не изменилось, UPDATE не выполняется.
+        """
+        self.update_tags(validated_data.pop('tags'), instance)
+        update_carts_with_recipe(instance, self.update_ingredients(
+            validated_data.pop('recipe_ingredient'), instance))
+        old_image = instance.image.name
+        changed = [
+            field for field, value in validated_data.items()
+            if field == 'image' or getattr(instance, field) != value
+        ]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        if changed:
+            instance.save(update_fields=changed)
+        recipe = instance
+        if recipe.image.name != old_image:
+            recipe.image_variants = {}
+            recipe.save(update_fields=['image_variants'])
+            schedule_image_variants(recipe)
+        return recipe
@@ -0,0 +1,86 @@
+from os import path
+from tempfile import SpooledTemporaryFile
+
+from django.http import FileResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+app_path = path.realpath(path.dirname(__file__))
+font_path = path.join(app_path, 'fonts/timesnewromanpsmt.ttf')
+
+FONT_NAME = 'TNR'
+TITLE = 'Список покупок'
+TITLE_FONT_SIZE = 24
+FONT_SIZE = 12
+LINE_HEIGHT = 16
+ITEM_SPACING = 4
+MARGIN = 50
+COLUMNS = 2
+COLUMN_GAP = 20
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def register_font():
+    """Регистрирует шрифт один раз на процесс.
+
+    ReportLab встраивает в документ только подмножество глифов,
+    которые использованы в тексте, а не весь файл шрифта.
+    """
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+
+
+def render_shopping_list(shopping_list, output):
+    """Записывает список покупок в output в виде PDF в несколько колонок."""
+    register_font()
+    width, height = A4
+    column_width = (
+        width - 2 * MARGIN - (COLUMNS - 1) * COLUMN_GAP) / COLUMNS
+    sheet = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+    sheet.setTitle(TITLE)
+    sheet.setFont(FONT_NAME, TITLE_FONT_SIZE)
+    sheet.drawString(MARGIN, height - MARGIN, f'{TITLE}:')
+    top = height - MARGIN - TITLE_FONT_SIZE - LINE_HEIGHT
+    column, position_y = 0, top
+    sheet.setFont(FONT_NAME, FONT_SIZE)
+    for number, item in enumerate(shopping_list, start=1):
+        text = (
+            f'{number}. {item["ingredient__name"]} - '
+            f'{item["ingredient_total"]} '
+            f'{item["ingredient__measurement_unit"]}'
+        )
+        lines = [text]
+        if pdfmetrics.stringWidth(text, FONT_NAME, FONT_SIZE) > column_width:
+            lines = simpleSplit(text, FONT_NAME, FONT_SIZE, column_width)
+        if position_y - LINE_HEIGHT * (len(lines) - 1) < MARGIN:
+            column += 1
+            position_y = top
+            if column == COLUMNS:
+                sheet.showPage()
+                sheet.setFont(FONT_NAME, FONT_SIZE)
+                column, top = 0, height - MARGIN
+                position_y = top
+        position_x = MARGIN + column * (column_width + COLUMN_GAP)
+        for line in lines:
+            sheet.drawString(position_x, position_y, line)
+            position_y -= LINE_HEIGHT
+        position_y -= ITEM_SPACING
+    sheet.showPage()
+    sheet.save()
+    return output
+
+
+def shopping_list_response(shopping_list):
+    """Отдает PDF частями из временного файла, а не одним буфером."""
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    render_shopping_list(shopping_list, output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename='shopping_cart.pdf',
+        content_type='application/pdf'
+    )
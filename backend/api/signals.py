@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import (Favorite, Ingredient, Purchase, Recipe, RecipeTag,
+                            Tag)
+from recipes.search import update_search_vectors
+from rest_framework.authtoken.models import Token
+from users.models import Subscription, User
+
+from .authentication import token_cache
+from .catalog import bump_catalog_version, bump_version
+from .facets import RECIPES_VERSION_KEY, get_user_recipes_version_key
+from .feed import backfill_feed, fan_out_recipe, remove_from_feed
+from .ingredient_index import ingredient_index
+from .recipe_search import recipe_search_index
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeTag)
+def invalidate_recipes(sender, **kwargs):
+    bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Purchase)
+@receiver(post_delete, sender=Purchase)
+def invalidate_user_recipes(sender, instance, **kwargs):
+    key = get_user_recipes_version_key(instance.user_id)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: fan_out_recipe(instance))
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_subscription_feed(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: backfill_feed(
+            instance.user_id, [instance.author_id]))
+
+
+@receiver(post_delete, sender=Subscription)
+def clear_subscription_feed(sender, instance, **kwargs):
+    remove_from_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+        recipe_search_index.invalidate()
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_search(sender, **kwargs):
+    recipe_search_index.invalidate()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields, **kwargs):
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        token_cache.delete_user(instance.pk)
@@ -0,0 +1,508 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from io import StringIO
+from threading import Barrier
+from time import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import (DEFAULT_DB_ALIAS, IntegrityError, connection,
+                       connections, router, transaction)
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings, skipUnlessDBFeature)
+from recipes.models import (CartIngredient, Favorite, Ingredient, Purchase,
+                            Recipe, RecipeIngredient, Tag)
+from recipes.storage import content_addressed_storage
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscription, User
+
+from .async_views import authenticate
+from .authentication import get_token_cache_key
+from .db_routing import PRIMARY_COOKIE, routing_state, start_routing
+from .utils import (BULK_CREATE_ATTEMPTS, add_recipe_relation,
+                    remove_recipe_relation)
+
+THREADS = 8
+SHARED_AMOUNT = 10
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAD'
+    'UlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+DATABASE_TOKEN_CACHES = {
+    **LOCAL_CACHES,
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'token_cache',
+    },
+}
+# В PostgreSQL после сохранения названия и описания пересчитывается
+# search_vector.
+SEARCH_VECTOR_QUERIES = int(connection.vendor == 'postgresql')
+REPLICA = 'replica_stand_in'
+
+# Вторая база SQLite, которая заменяет реплику. Она регистрируется
+# при импорте модуля, чтобы тестовый раннер создал и удалил ее вместе
+# с основной тестовой базой.
+connections.settings.setdefault(REPLICA, connections.configure_settings({
+    DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+    REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+})[REPLICA])
+
+
+def run_in_parallel(function, arguments):
+    """Одновременно вызывает function в отдельных потоках и соединениях."""
+    barrier = Barrier(len(arguments))
+
+    def run(args):
+        barrier.wait()
+        try:
+            return function(*args)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(len(arguments)) as executor:
+        return list(executor.map(run, arguments))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ParallelTogglesTest(TransactionTestCase):
+    """Параллельные добавления и удаления избранного и покупок.
+
+    Нужна СУБД с блокировкой строк, например PostgreSQL: SQLite
+    не дает параллельным транзакциям писать одновременно.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='password')
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='password')
+        self.shared = Ingredient.objects.create(
+            name='Соль', measurement_unit='г')
+        self.recipes = []
+        for number in range(THREADS):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10)
+            own = Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г')
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe, ingredient=self.shared,
+                    amount=SHARED_AMOUNT),
+                RecipeIngredient(recipe=recipe, ingredient=own, amount=1),
+            ])
+            self.recipes.append(recipe)
+
+    def test_same_favorite_is_added_once(self):
+        recipe = self.recipes[0]
+        results = run_in_parallel(
+            add_recipe_relation, [(self.user, recipe, Favorite)] * THREADS)
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_recipes_with_shared_ingredient_are_added_to_cart(self):
+        results = run_in_parallel(add_recipe_relation, [
+            (self.user, recipe, Purchase) for recipe in self.recipes])
+        self.assertEqual(results, [True] * THREADS)
+        self.assertEqual(
+            Purchase.objects.filter(user=self.user).count(), THREADS)
+        amounts = dict(CartIngredient.objects.filter(
+            user=self.user).values_list('ingredient_id', 'amount'))
+        self.assertEqual(amounts.pop(self.shared.id), SHARED_AMOUNT * THREADS)
+        self.assertEqual(list(amounts.values()), [1] * THREADS)
+
+    def test_same_purchase_is_removed_once(self):
+        recipe = self.recipes[0]
+        add_recipe_relation(self.user, recipe, Purchase)
+        results = run_in_parallel(
+            remove_recipe_relation,
+            [(self.user, recipe.id, Purchase)] * THREADS)
+        self.assertEqual(results.count(True), 1)
+        self.assertFalse(
+            CartIngredient.objects.filter(user=self.user).exists())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.in_carts_count, 0)
+
+
+class BulkConflictTest(TestCase):
+    """Пакетное добавление, которое постоянно конфликтует с другим запросом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание', cooking_time=10)
+
+    def test_retries_are_limited(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(
+                Favorite.objects, 'bulk_create',
+                side_effect=IntegrityError) as bulk_create:
+            response = client.post(
+                '/api/recipes/favorite/', {'ids': [self.recipe.id]},
+                format='json')
+        self.assertEqual(response.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(bulk_create.call_count, BULK_CREATE_ATTEMPTS)
+        self.assertFalse(Favorite.objects.exists())
+
+
+class SubscribeTest(TestCase):
+    """Подписка на автора с параметром recipes_limit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='password')
+
+    def test_invalid_limit_does_not_subscribe(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            f'/api/users/{self.author.id}/subscribe/?recipes_limit=abc')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertFalse(Subscription.objects.exists())
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ToggleQueriesTest(TestCase):
+    """Число SQL-запросов при добавлении и удалении избранного и покупок.
+
+    В TestCase транзакция запроса и savepoint вокруг INSERT дают
+    по два запроса SAVEPOINT и RELEASE. Версия данных пользователя
+    для фасетов меняется в общем кэше после фиксации и запросов к БД
+    не добавляет.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Описание', cooking_time=10)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=cls.recipe, amount=10,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit='г'))
+            for name in ('Мука', 'Соль')
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, method, path, queries):
+        with self.assertNumQueries(queries):
+            with self.captureOnCommitCallbacks(execute=True):
+                return getattr(self.client, method)(
+                    f'/api/recipes/{self.recipe.id}/{path}/')
+
+    def test_favorite(self):
+        # Рецепт, INSERT в savepoint и счетчик favorites_count (user-020).
+        response = self.toggle('post', 'favorite', 3 + 4)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        # Выборка и DELETE (у Favorite есть сигналы) и счетчик.
+        response = self.toggle('delete', 'favorite', 3 + 2)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+    def test_shopping_cart(self):
+        # К запросам избранного добавляется список покупок (user-005):
+        # состав рецепта, строки списка SELECT ... FOR UPDATE в savepoint
+        # повторной попытки и одна массовая вставка новых строк.
+        response = self.toggle('post', 'shopping_cart', 3 + 4 + 5)
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        # Обновление и удаление строк списка делаются одним запросом
+        # каждое, здесь строки только удаляются.
+        response = self.toggle('delete', 'shopping_cart', 3 + 2 + 5)
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+
+
+class MergeDuplicateIngredientsTest(TransactionTestCase):
+    """Слияние дублей ингредиентов в базе без уникального ограничения."""
+
+    def setUp(self):
+        constraint, = Ingredient._meta.constraints
+        # SQLite пересоздает таблицу по ограничениям модели.
+        with mock.patch.object(Ingredient._meta, 'constraints', []):
+            with connection.schema_editor() as editor:
+                editor.remove_constraint(Ingredient, constraint)
+        self.addCleanup(self.restore_constraint, constraint)
+
+    def restore_constraint(self, constraint):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Ingredient._meta.db_table)
+        if constraint.name not in constraints:
+            with connection.schema_editor() as editor:
+                editor.add_constraint(Ingredient, constraint)
+
+    def test_duplicates_are_merged(self):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        recipe = Recipe.objects.create(
+            author=user, name='Рецепт', text='Описание', cooking_time=10)
+        salt, duplicate, other = Ingredient.objects.bulk_create([
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Соль', measurement_unit='г'),
+            Ingredient(name='Соль', measurement_unit='кг'),
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=salt, amount=5),
+            RecipeIngredient(recipe=recipe, ingredient=duplicate, amount=3),
+            RecipeIngredient(recipe=recipe, ingredient=other, amount=1),
+        ])
+        CartIngredient.objects.create(
+            user=user, ingredient=duplicate, amount=7)
+
+        call_command('merge_duplicate_ingredients', stdout=StringIO())
+
+        self.assertEqual(
+            set(Ingredient.objects.values_list('id', flat=True)),
+            {salt.id, other.id})
+        self.assertEqual(
+            dict(recipe.recipe_ingredient.values_list(
+                'ingredient_id', 'amount')),
+            {salt.id: 8, other.id: 1})
+        self.assertEqual(
+            list(CartIngredient.objects.values_list(
+                'ingredient_id', 'amount')),
+            [(salt.id, 7)])
+        with self.assertRaises(IntegrityError):
+            Ingredient.objects.create(name='Соль', measurement_unit='г')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class CatalogCacheTest(TestCase):
+    """Ответы справочников из памяти процесса по версии в общем кэше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def test_not_modified_without_queries(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_ingredient_search_without_queries(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        Ingredient.objects.create(name='Сода', measurement_unit='г')
+        self.client.get('/api/ingredients/?name=со')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=сол')
+        self.assertEqual(
+            [ingredient['name'] for ingredient in response.json()], ['Соль'])
+        self.assertNotIn('ETag', response)
+
+    def test_change_invalidates_response(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 2)
+
+
+@override_settings(CACHES=DATABASE_TOKEN_CACHES, TOKEN_CACHE_ALIAS='tokens')
+class AsyncSharedTokenCacheTest(TestCase):
+    """Асинхронная аутентификация с общим кэшем токенов в базе данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='password')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        call_command('createcachetable', 'token_cache')
+
+    async def test_token_is_cached(self):
+        request = RequestFactory().get(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(await authenticate(request), self.user)
+        cached = await caches['tokens'].aget(
+            get_token_cache_key(self.token.key))
+        self.assertEqual(cached.user, self.user)
+        self.assertEqual(await authenticate(request), self.user)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageCollectionTest(TestCase):
+    """Сборка неиспользуемых изображений рецептов."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_reuploaded_orphan_is_kept(self):
+        content = b'recipe image'
+        name = content_addressed_storage.save(
+            'recipes/images/orphan.png', ContentFile(content))
+        two_days_ago = time() - 2 * 24 * 60 * 60
+        os.utime(
+            content_addressed_storage.path(name),
+            (two_days_ago, two_days_ago))
+        self.assertEqual(content_addressed_storage.save(
+            'recipes/images/again.png', ContentFile(content)), name)
+        call_command('collect_recipe_images', stdout=StringIO())
+        self.assertTrue(content_addressed_storage.exists(name))
+
+
+@override_settings(CACHES=LOCAL_CACHES, MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteQueriesTest(TestCase):
+    """Число SQL-запросов при создании и изменении рецепта.
+
+    Кэш подменяется локальным, чтобы результат не зависел от состояния
+    общего кэша, а изображения сохраняются во временный каталог.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='password')
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+            )
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Сахар', 'Соль')
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.data = {
+            'name': 'Блины',
+            'text': 'Смешать и обжарить.',
+            'cooking_time': 30,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 100}
+                for ingredient in self.ingredients[:2]
+            ],
+        }
+
+    def create_recipe(self):
+        response = self.client.post(
+            '/api/recipes/', {**self.data, 'image': IMAGE}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_create(self):
+        # Проверка ингредиентов и тегов, вставка рецепта, тегов
+        # и ингредиентов в savepoint, чтение состава и тегов для ответа.
+        with self.assertNumQueries(9 + SEARCH_VECTOR_QUERIES):
+            self.create_recipe()
+
+    def test_noop_update(self):
+        recipe_id = self.create_recipe()
+        # Рецепт с флагами, проверка, текущие теги и состав в savepoint,
+        # состав и теги для ответа. UPDATE рецепта не выполняется.
+        with self.assertNumQueries(9):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/', self.data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_partial_update(self):
+        recipe_id = self.create_recipe()
+        self.data['cooking_time'] = 45
+        self.data['tags'] = [self.tags[0].id]
+        self.data['ingredients'][0]['amount'] = 200
+        # К пустому изменению добавляются выборка и удаление тега
+        # (у RecipeTag есть сигналы), UPDATE состава, выборка списков
+        # покупок с рецептом и UPDATE рецепта.
+        with self.assertNumQueries(14):
+            response = self.client.patch(
+                f'/api/recipes/{recipe_id}/', self.data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cooking_time'], 45)
+        self.assertEqual(response.data['tags'], [self.tags[0].id])
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], CACHES=LOCAL_CACHES)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Маршрутизация чтения между основной базой и репликой.
+
+    Реплику заменяет отдельная база SQLite. Пользователи в ней создаются
+    независимо от основной базы, поэтому по ответу видно, из какой базы
+    прочитаны данные.
+    """
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def setUp(self):
+        User.objects.create(username='primary', email='primary@example.com')
+        User.objects.using(REPLICA).create(
+            username='replica', email='replica@example.com')
+
+    def get_usernames(self):
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.data['results']]
+
+    def test_safe_request_reads_replica(self):
+        self.assertEqual(self.get_usernames(), ['replica'])
+        self.assertNotIn(PRIMARY_COOKIE, self.client.cookies)
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post('/api/users/', {
+            'email': 'new@example.com',
+            'username': 'new',
+            'first_name': 'Новый',
+            'last_name': 'Пользователь',
+            'password': 'Str0ng-password',
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            response.cookies[PRIMARY_COOKIE]['max-age'],
+            settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.get_usernames(), ['primary', 'new'])
+        del self.client.cookies[PRIMARY_COOKIE]
+        self.assertEqual(self.get_usernames(), ['replica'])
+
+    def test_reads_inside_atomic_use_primary(self):
+        state, token = start_routing(RequestFactory().get('/api/users/'))
+        try:
+            self.assertEqual(User.objects.get().username, 'replica')
+            with transaction.atomic():
+                self.assertEqual(User.objects.get().username, 'primary')
+        finally:
+            routing_state.reset(token)
+        self.assertFalse(state.wrote)
+
+    def test_reads_outside_request_use_primary(self):
+        self.assertEqual(router.db_for_read(User), DEFAULT_DB_ALIAS)
+        self.assertEqual(User.objects.get().username, 'primary')
+
+    async def test_async_request_reads_replica(self):
+        response = await self.async_client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [user['username'] for user in response.json()['results']],
+            ['replica'])
@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (DownloadShoppingCartViewSet, FavoriteViewSet,
-                    IngredientViewSet, RecipeViewSet, ShoppingCartViewSet,
-                    SubscribeViewSet, SubscriptionViewSet, TagsViewSet,
-                    UserViewSet)
+from .views import (BulkFavoriteViewSet, BulkShoppingCartViewSet,
+                    BulkSubscribeViewSet, DownloadShoppingCartViewSet,
+                    FavoriteViewSet, IngredientViewSet, RecipeViewSet,
+                    ShoppingCartViewSet, SubscribeViewSet, SubscriptionViewSet,
+                    TagsViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -26,9 +28,25 @@ urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
     path(
         'users/subscriptions/', SubscriptionViewSet.as_view({'get': 'list'})),
+    path('users/subscribe/', BulkSubscribeViewSet.as_view()),
     path(
         'recipes/download_shopping_cart/',
         DownloadShoppingCartViewSet.as_view(), name='download'),
+    path('recipes/favorite/', BulkFavoriteViewSet.as_view()),
+    path('recipes/shopping_cart/', BulkShoppingCartViewSet.as_view()),
     path('', include('djoser.urls')),
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_API_VIEWS:
+    from . import async_views
+
+    urlpatterns = [
+        path('recipes/', async_views.recipe_list),
+        path('recipes/<int:recipe_id>/favorite/', async_views.favorite),
+        path(
+            'recipes/<int:recipe_id>/shopping_cart/',
+            async_views.shopping_cart
+        ),
+        path('users/<int:user_id>/subscribe/', async_views.subscribe),
+    ] + urlpatterns
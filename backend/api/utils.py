@@ -1,10 +1,40 @@
 from http import HTTPStatus
 
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Sum, Value, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from recipes.models import Recipe
+from recipes.models import (CartIngredient, Favorite, Purchase, Recipe,
+                            RecipeIngredient)
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import exception_handler
-from users.models import Subscription
+from users.models import Subscription, User
+
+from .catalog import bump_version
+from .facets import get_user_recipes_version_key
+from .feed import backfill_feed
+
+BULK_CREATED = 'created'
+BULK_EXISTS = 'exists'
+BULK_NOT_FOUND = 'not_found'
+BULK_SELF = 'self'
+
+CART_UPDATE_ATTEMPTS = 3
+BULK_CREATE_ATTEMPTS = 3
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    Purchase: 'in_carts_count',
+}
+
+
+class BulkConflict(APIException):
+    status_code = HTTPStatus.CONFLICT
+    default_detail = ('Записи одновременно изменяются другим запросом, '
+                      'повторите попытку.')
+    default_code = 'conflict'
 
 
 def custom_exception_handler(exc, context):
@@ -16,38 +46,307 @@ def custom_exception_handler(exc, context):
     return response
 
 
+def get_subscribed_ids(context):
+    """Возвращает id авторов, на которых подписан текущий пользователь.
+
+    Множество загружается одним запросом и сохраняется в контексте
+    сериализатора, поэтому используется всеми строками списка.
+    """
+    if 'subscribed_ids' not in context:
+        context['subscribed_ids'] = set(
+            Subscription.objects.filter(
+                user=context['request'].user
+            ).values_list('author_id', flat=True)
+        )
+    return context['subscribed_ids']
+
+
+def annotate_subscribed(queryset, user, author_field='pk'):
+    """Добавляет к выборке флаг подписки текущего пользователя."""
+    if user.is_anonymous:
+        return queryset.annotate(subscribed=Value(False))
+    return queryset.annotate(subscribed=Exists(
+        Subscription.objects.filter(user=user, author=OuterRef(author_field))
+    ))
+
+
 def func_subscribed(self, obj):
     request = self.context.get('request')
     if not request:
         return True
     if request.user.is_anonymous or obj is None:
         return False
-    else:
-        return (
-            Subscription.objects.filter(
-                user=request.user,
-                author__id=obj.id
-            ).exists()
-            and request.user.is_authenticated
+    if hasattr(obj, 'subscribed'):
+        return obj.subscribed
+    return obj.id in get_subscribed_ids(self.context)
+
+
+def get_recipes_limit(request):
+    """Проверяет параметр recipes_limit до выполнения запросов к БД."""
+    if request is None or 'recipes_limit' not in request.query_params:
+        return None
+    recipes_limit = request.query_params['recipes_limit']
+    if not recipes_limit.isdigit() or int(recipes_limit) < 1:
+        raise ValidationError(
+            {'recipes_limit': 'Укажите целое положительное число'})
+    return int(recipes_limit)
+
+
+def get_latest_recipes(author_ids, recipes_limit=None):
+    """Возвращает последние рецепты авторов одним запросом.
+
+    Рецепты нумеруются внутри каждого автора оконной функцией
+    ROW_NUMBER() и отбираются первые recipes_limit из них.
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if recipes_limit is not None:
+        ranked = recipes.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('pub_date').desc(),
+        )).values(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id', 'pub_date', 'row_number'
+        )
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE ranked.row_number <= %s '
+            'ORDER BY ranked.pub_date DESC',
+            (*params, recipes_limit)
         )
+    latest_recipes = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        latest_recipes[recipe.author_id].append(recipe)
+    return latest_recipes
+
+
+def get_recipe_amounts(recipe):
+    """Возвращает количества ингредиентов рецепта по их id."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe=recipe).values_list('ingredient_id', 'amount'))
+
+
+def get_recipes_amounts(recipe_ids):
+    """Возвращает суммарные количества ингредиентов нескольких рецептов."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids).values('ingredient_id').annotate(
+            total=Sum('amount')).order_by().values_list(
+                'ingredient_id', 'total'))
+
+
+def update_cart_ingredients(user_ids, amounts):
+    """Изменяет суммы ингредиентов в списках покупок пользователей.
+
+    amounts — изменения количества по id ингредиента. Вызывается в той же
+    транзакции, что и изменение списка покупок или состава рецепта.
+    Если параллельная транзакция успела вставить ту же строку списка,
+    изменения повторяются поверх нее, но не больше CART_UPDATE_ATTEMPTS раз.
+    """
+    amounts = {
+        ingredient_id: amount
+        for ingredient_id, amount in amounts.items() if amount
+    }
+    if not user_ids or not amounts:
+        return
+    for attempt in range(1, CART_UPDATE_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                apply_cart_changes(user_ids, amounts)
+            return
+        except IntegrityError:
+            if attempt == CART_UPDATE_ATTEMPTS:
+                raise
+
+
+def apply_cart_changes(user_ids, amounts):
+    existing = {
+        (row.user_id, row.ingredient_id): row
+        for row in CartIngredient.objects.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=amounts)
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, amount in amounts.items():
+            row = existing.get((user_id, ingredient_id))
+            if row is None:
+                if amount > 0:
+                    to_create.append(CartIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    ))
+                continue
+            row.amount += amount
+            if row.amount > 0:
+                to_update.append(row)
+            else:
+                to_delete.append(row.pk)
+    if to_create:
+        CartIngredient.objects.bulk_create(to_create)
+    if to_update:
+        CartIngredient.objects.bulk_update(to_update, ['amount'])
+    if to_delete:
+        CartIngredient.objects.filter(pk__in=to_delete).delete()
+
+
+def update_carts_with_recipe(recipe, amounts):
+    """Переносит изменение состава рецепта в списки покупок с ним."""
+    if not any(amounts.values()):
+        return
+    update_cart_ingredients(
+        list(Purchase.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True)),
+        amounts
+    )
+
+
+def update_recipe_counters(recipe_ids, modelname, delta):
+    """Изменяет счетчик избранного или покупок у рецептов.
+
+    Значение считается в самой БД через F(), поэтому параллельные
+    изменения не теряются.
+    """
+    field = RECIPE_COUNTERS[modelname]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def add_recipe_relation(user, recipe, modelname):
+    """Добавляет рецепт в избранное или покупки пользователя.
+
+    Повторное добавление отсекается уникальным ограничением в БД,
+    а не предварительной проверкой, поэтому параллельные запросы
+    не приводят к ошибке сервера. Возвращает False, если запись уже есть.
+    Само переключение — это INSERT, к нему добавляются UPDATE счетчика
+    рецепта и, для покупок, чтение состава рецепта, блокировка строк
+    списка покупок и их вставка или изменение.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                modelname.objects.create(user=user, recipe=recipe)
+        except IntegrityError:
+            return False
+        update_recipe_counters([recipe.id], modelname, 1)
+        if modelname is Purchase:
+            update_cart_ingredients([user.id], get_recipe_amounts(recipe))
+    return True
+
+
+def remove_recipe_relation(user, recipe_id, modelname):
+    """Удаляет рецепт из избранного или покупок пользователя.
+
+    Возвращает False, если такой записи не было.
+    """
+    with transaction.atomic():
+        deleted, _ = modelname.objects.filter(
+            user=user, recipe_id=recipe_id).delete()
+        if deleted:
+            update_recipe_counters([recipe_id], modelname, -1)
+        if deleted and modelname is Purchase:
+            update_cart_ingredients([user.id], {
+                ingredient_id: -amount
+                for ingredient_id, amount
+                in get_recipe_amounts(recipe_id).items()
+            })
+    return bool(deleted)
+
+
+def bulk_create_relations(ids, get_statuses, create_objects):
+    """Создает недостающие связи одним bulk-запросом.
+
+    get_statuses проверяет все id одним запросом и возвращает статусы,
+    create_objects вставляет записи со статусом BULK_CREATED. Уже
+    существующие связи в вставку не попадают, а если параллельный
+    запрос успел добавить часть из них, статусы пересчитываются заново:
+    так известно, какие записи добавлены именно этим запросом.
+    После BULK_CREATE_ATTEMPTS неудачных попыток возвращается 409.
+    """
+    for _ in range(BULK_CREATE_ATTEMPTS):
+        statuses = get_statuses()
+        created_ids = [
+            item_id for item_id in ids
+            if statuses.get(item_id) == BULK_CREATED
+        ]
+        try:
+            with transaction.atomic():
+                if created_ids:
+                    create_objects(created_ids)
+        except IntegrityError:
+            continue
+        return [
+            {'id': item_id, 'status': statuses.get(item_id, BULK_NOT_FOUND)}
+            for item_id in ids
+        ]
+    raise BulkConflict
+
+
+def bulk_add_recipe_relations(user, recipe_ids, modelname):
+    """Добавляет несколько рецептов в избранное или покупки пользователя."""
+    def get_statuses():
+        return {
+            recipe_id: BULK_EXISTS if added else BULK_CREATED
+            for recipe_id, added in Recipe.objects.filter(
+                id__in=recipe_ids
+            ).annotate(added=Exists(modelname.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            ).values_list('id', 'added')
+        }
+
+    def create_objects(created_ids):
+        modelname.objects.bulk_create([
+            modelname(user=user, recipe_id=recipe_id)
+            for recipe_id in created_ids
+        ])
+        update_recipe_counters(created_ids, modelname, 1)
+        if modelname is Purchase:
+            update_cart_ingredients(
+                [user.id], get_recipes_amounts(created_ids))
+
+    results = bulk_create_relations(recipe_ids, get_statuses, create_objects)
+    if any(result['status'] == BULK_CREATED for result in results):
+        bump_version(get_user_recipes_version_key(user.id))
+    return results
+
+
+def bulk_subscribe(user, author_ids):
+    """Подписывает пользователя на несколько авторов."""
+    def get_statuses():
+        statuses = {
+            author_id: BULK_EXISTS if subscribed else BULK_CREATED
+            for author_id, subscribed in annotate_subscribed(
+                User.objects.filter(id__in=author_ids), user
+            ).values_list('id', 'subscribed')
+        }
+        if user.id in statuses:
+            statuses[user.id] = BULK_SELF
+        return statuses
+
+    def create_objects(created_ids):
+        Subscription.objects.bulk_create([
+            Subscription(user=user, author_id=author_id)
+            for author_id in created_ids
+        ])
+        transaction.on_commit(lambda: backfill_feed(user.id, created_ids))
+
+    return bulk_create_relations(author_ids, get_statuses, create_objects)
 
 
 def create_favorites_shopcart(request, modelname,
                               serializername, *args, **kwargs):
     recipe_id = kwargs.get('recipe_id')
     recipe = get_object_or_404(Recipe, id=recipe_id)
-    if modelname.objects.filter(user=request.user, recipe=recipe).exists():
+    if not add_recipe_relation(request.user, recipe, modelname):
         return Response(
             'Рецепт уже добавлен',
             status=HTTPStatus.BAD_REQUEST,
         )
-    modelname.objects.create(user=request.user, recipe=recipe)
     serializer = serializername(recipe, many=False)
     return Response(data=serializer.data, status=HTTPStatus.CREATED)
 
 
 def delete_favorites_shopcart(request, modelname, *args, **kwargs):
     recipe_id = kwargs.get('recipe_id')
-    recipe = get_object_or_404(Recipe, id=recipe_id)
-    get_object_or_404(modelname, user=request.user, recipe=recipe).delete()
+    if not remove_recipe_relation(request.user, recipe_id, modelname):
+        raise Http404
     return Response(status=HTTPStatus.NO_CONTENT)
@@ -1,37 +1,42 @@
 from http import HTTPStatus
-from os import path
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (Favorite, Ingredient, Purchase, Recipe,
-                            RecipeIngredient, Tag)
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from recipes.models import (CartIngredient, Favorite, Ingredient, Purchase,
+                            Recipe, Tag)
 from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from users.models import Subscription, User
 
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import CreateDestroyViewSet, ListRetrieveViewSet
-from .pagination import PageLimitPagination
+from .facets import get_tag_facets
+from .feed import get_feed
+from .filters import RecipeFilter
+from .ingredient_index import ingredient_index
+from .mixins import (CatalogCacheMixin, CreateDestroyViewSet,
+                     ListRetrieveViewSet)
+from .pagination import FeedPagination, PageLimitPagination, RecipePagination
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeCreateUpdateSerializer, RecipeSerializer,
-                          RecipeShortSerializer, ShoppingCartSerializer,
-                          SubscriptionSerializer, TagSerializer,
-                          UserSerializer)
-from .utils import create_favorites_shopcart, delete_favorites_shopcart
-
-app_path = path.realpath(path.dirname(__file__))
-font_path = path.join(app_path, 'fonts/timesnewromanpsmt.ttf')
-
-
-class TagsViewSet(ListRetrieveViewSet):
+from .serializers import (BulkIdsSerializer, FavoriteSerializer,
+                          IngredientSerializer, RecipeCreateUpdateSerializer,
+                          RecipeSerializer, RecipeShortSerializer,
+                          ShoppingCartSerializer, SubscriptionSerializer,
+                          TagSerializer, UserSerializer)
+from .shopping_list import shopping_list_response
+from .utils import (annotate_subscribed, bulk_add_recipe_relations,
+                    bulk_subscribe, create_favorites_shopcart,
+                    delete_favorites_shopcart, get_latest_recipes,
+                    get_recipe_amounts, get_recipes_limit,
+                    update_carts_with_recipe)
+
+
+class TagsViewSet(CatalogCacheMixin, ListRetrieveViewSet):
     queryset = Tag.objects.all()
     pagination_class = None
     serializer_class = TagSerializer
@@ -43,7 +48,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthorOrReadOnly, ]
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = RecipeFilter
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        """Связи для сериализатора чтения подгружаются только при чтении.
+
+        После изменения рецепта DRF все равно сбрасывает подгруженные
+        связи, поэтому для записи достаточно флагов пользователя.
+        """
+        if self.request.method in permissions.SAFE_METHODS:
+            return Recipe.objects.for_user(self.request.user)
+        return Recipe.objects.with_user_flags(self.request.user)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -54,27 +69,95 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, permission_classes=[permissions.AllowAny, ])
+    def facets(self, request):
+        params = request.query_params.copy()
+        params.pop('tags', None)
+        filterset = RecipeFilter(
+            params, queryset=Recipe.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return Response(get_tag_facets(filterset, request.user))
+
+    @action(
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated, ],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        queryset = self.filter_queryset(get_feed(request.user))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        update_carts_with_recipe(instance, {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(instance).items()
+        })
+        instance.delete()
+
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = PageLimitPagination
 
+    def get_queryset(self):
+        return annotate_subscribed(User.objects.all(), self.request.user)
+
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(CatalogCacheMixin, ListRetrieveViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = [permissions.AllowAny, ]
     serializer_class = IngredientSerializer
-    filter_backends = [DjangoFilterBackend, IngredientFilter]
     pagination_class = None
-    search_fields = ['^name', ]
+
+    def filter_queryset(self, queryset):
+        if self.action != 'list':
+            return super().filter_queryset(queryset)
+        return ingredient_index.search(
+            self.request.query_params.get('name', ''),
+            settings.INGREDIENTS_SEARCH_LIMIT
+        )
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по name отдается прямо из индекса в памяти,
+        минуя кэш ответов: у каждого префикса своя строка запроса."""
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(
+            name, settings.INGREDIENTS_SEARCH_LIMIT))
 
 
 class SubscriptionViewSet(ListRetrieveViewSet):
     serializer_class = SubscriptionSerializer
 
     def get_queryset(self):
-        return Subscription.objects.filter(user=self.request.user)
+        queryset = Subscription.objects.filter(
+            user=self.request.user
+        ).select_related('author').annotate(
+            recipes_count=Count('author__recipe_author')
+        ).order_by('author')
+        return annotate_subscribed(queryset, self.request.user, 'author')
+
+    def list(self, request, *args, **kwargs):
+        recipes_limit = get_recipes_limit(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        subscriptions = page if page is not None else list(queryset)
+        context = self.get_serializer_context()
+        context['latest_recipes'] = get_latest_recipes(
+            [subscription.author_id for subscription in subscriptions],
+            recipes_limit
+        )
+        serializer = self.get_serializer_class()(
+            subscriptions, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
 
 class SubscribeViewSet(CreateDestroyViewSet):
@@ -82,6 +165,7 @@ class SubscribeViewSet(CreateDestroyViewSet):
     permission_classes = [permissions.IsAuthenticated, ]
 
     def create(self, request, *args, **kwargs):
+        get_recipes_limit(request)
         author_id = self.kwargs.get('user_id')
         author = get_object_or_404(User, id=author_id)
         if author == request.user:
@@ -89,32 +173,41 @@ class SubscribeViewSet(CreateDestroyViewSet):
                 'Нельзя подписаться на себя',
                 status=HTTPStatus.BAD_REQUEST
             )
-        if Subscription.objects.filter(
-                author=author, user=self.request.user).exists():
+        try:
+            with transaction.atomic():
+                subscription = Subscription.objects.create(
+                    author=author, user=self.request.user)
+        except IntegrityError:
             return Response(
                 'Вы уже подписаны на данного автора',
                 status=HTTPStatus.BAD_REQUEST
             )
-        Subscription.objects.create(author=author, user=self.request.user)
-        subscription = get_object_or_404(
-            Subscription,
-            author=author,
-            user=self.request.user
-        )
-        serializer = SubscriptionSerializer(subscription, many=False)
+        subscription.subscribed = True
+        serializer = SubscriptionSerializer(
+            subscription, context=self.get_serializer_context())
         return Response(data=serializer.data, status=HTTPStatus.CREATED)
 
     def delete(self, request, *args, **kwargs):
-        author_id = self.kwargs.get('user_id')
-        author = get_object_or_404(User, id=author_id)
-        get_object_or_404(
-            Subscription,
-            author=author,
+        deleted, _ = Subscription.objects.filter(
+            author_id=self.kwargs.get('user_id'),
             user=self.request.user
         ).delete()
+        if not deleted:
+            raise Http404
         return Response(status=HTTPStatus.NO_CONTENT)
 
 
+class BulkSubscribeViewSet(APIView):
+    """Подписка на несколько авторов одним запросом."""
+    permission_classes = [permissions.IsAuthenticated, ]
+
+    def post(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': bulk_subscribe(
+            request.user, serializer.validated_data['ids'])})
+
+
 class FavoriteViewSet(CreateDestroyViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = [permissions.IsAuthenticated, ]
@@ -127,50 +220,34 @@ class FavoriteViewSet(CreateDestroyViewSet):
         return delete_favorites_shopcart(request, Favorite, *args, **kwargs)
 
 
-class DownloadShoppingCartViewSet(APIView):
+class BulkRecipeRelationViewSet(APIView):
+    """Добавление нескольких рецептов в избранное или покупки."""
     permission_classes = [permissions.IsAuthenticated, ]
+    modelname = None
 
-    @staticmethod
-    def canvas_method(shopping_list):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            'attachment; filename = "shopping_cart.pdf"')
-        begin_position_x, begin_position_y = 100, 650
-        sheet = canvas.Canvas(response, pagesize=A4)
-        pdfmetrics.registerFont(
-            TTFont('TNR', font_path)
-        )
-        sheet.setFont('TNR', 32)
-        sheet.setTitle('Список покупок')
-        sheet.drawString(
-            begin_position_x,
-            begin_position_y + 40,
-            'Список покупок: '
-        )
-        sheet.setFont('TNR', 20)
-        for number, item in enumerate(shopping_list, start=1):
-            if begin_position_y < 100:
-                begin_position_y = 700
-                sheet.showPage()
-                sheet.setFont('TNR', 20)
-            sheet.drawString(
-                begin_position_x,
-                begin_position_y,
-                f'{number}.  {item["ingredient__name"]} - '
-                f'{item["ingredient_total"]}'
-                f' {item["ingredient__measurement_unit"]}'
-            )
-            begin_position_y -= 30
-        sheet.showPage()
-        sheet.save()
-        return response
+    def post(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': bulk_add_recipe_relations(
+            request.user, serializer.validated_data['ids'], self.modelname)})
+
+
+class BulkFavoriteViewSet(BulkRecipeRelationViewSet):
+    modelname = Favorite
+
+
+class BulkShoppingCartViewSet(BulkRecipeRelationViewSet):
+    modelname = Purchase
+
+
+class DownloadShoppingCartViewSet(APIView):
+    permission_classes = [permissions.IsAuthenticated, ]
 
     def get(self, request):
-        result = RecipeIngredient.objects.filter(
-            recipe__recipeincart__user=request.user).values(
+        result = CartIngredient.objects.filter(user=request.user).values(
             'ingredient__name', 'ingredient__measurement_unit').order_by(
-                'ingredient__name').annotate(ingredient_total=Sum('amount'))
-        return self.canvas_method(result)
+                'ingredient__name').annotate(ingredient_total=F('amount'))
+        return shopping_list_response(result)
 
 
 class ShoppingCartViewSet(CreateDestroyViewSet):
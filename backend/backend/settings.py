@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.db_routing.replica_routing_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,6 +62,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+ASGI_APPLICATION = 'backend.asgi.application'
+
+ASYNC_API_VIEWS = os.getenv('ASYNC_API_VIEWS', 'False') == 'True'
+
 
 DATABASES = {
     'default': {
@@ -73,6 +78,33 @@ DATABASES = {
     }
 }
 
+DATABASES.update({
+    f'replica{number}': {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    for number, host in enumerate(
+        host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host)
+})
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['api.db_routing.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,11 +145,31 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageLimitPagination',
 }
 
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS')
+
+TOKEN_CACHE_MAX_SIZE = 10000
+
+TOKEN_CACHE_TIMEOUT = 5 * 60
+
+INGREDIENTS_SEARCH_LIMIT = 50
+
+BULK_IDS_LIMIT = 100
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_DIMENSION = 5000
+
 DJOSER = {
     'SERIALIZERS': {
         'user': 'api.serializers.UserSerializer',
@@ -133,3 +185,7 @@ DJOSER = {
 
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+FEED_MAX_LENGTH = 500
+
+FEED_FANOUT_MAX_FOLLOWERS = 1000
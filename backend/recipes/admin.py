@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Count
 
 from .models import (Favorite, Ingredient, Purchase, Recipe, RecipeIngredient,
                      Tag)
@@ -23,20 +22,13 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'author', 'get_favorite_count']
+    list_display = ['name', 'author', 'favorites_count', 'in_carts_count']
     list_filter = ['tags__name', 'author', 'name']
     search_fields = ['name', 'author__username']
+    readonly_fields = ['favorites_count', 'in_carts_count']
     inlines = [RecipeIngredientInLine, FavoriteInLine]
     ordering = ['-id', ]
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(favorite_count=Count('favoriterecipe'))
-
-    @staticmethod
-    def get_favorite_count(obj):
-        return obj.favorite_count
-
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
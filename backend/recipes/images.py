@@ -0,0 +1,93 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .storage import content_addressed_storage
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants'
+VARIANT_SIZES = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'detail': (1200, 1200),
+}
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_PROCESSING_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+
+
+def schedule_image_variants(recipe):
+    """Ставит подготовку уменьшенных копий изображения в очередь.
+
+    Задача отправляется в пул после фиксации транзакции, поэтому запрос
+    не ждет декодирования и сжатия изображения.
+    """
+    if not recipe.image:
+        return
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(build_image_variants, recipe_id, name))
+
+
+def get_missing_variants():
+    """Рецепты с изображением, для которых копии еще не построены.
+
+    Пул живет в памяти процесса, поэтому задачи, не выполненные
+    до перезапуска сервера, теряются. Такие рецепты остаются
+    с пустым image_variants и ставятся в очередь повторно.
+    """
+    return Recipe.objects.exclude(image='').filter(image_variants={})
+
+
+def open_image(name):
+    with content_addressed_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_image_variants(recipe_id, name):
+    """Сохраняет копии изображения рецепта для карточки, страницы
+    рецепта и миниатюры в форматах WebP и JPEG."""
+    try:
+        image = open_image(name)
+        stem = PurePosixPath(name).stem
+        variants = {}
+        for variant, size in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            variants[variant] = {}
+            for extension, (image_format, options) in (
+                    VARIANT_FORMATS.items()):
+                buffer = BytesIO()
+                resized.save(buffer, image_format, **options)
+                variants[variant][extension] = content_addressed_storage.save(
+                    f'{VARIANTS_DIR}/{stem}_{variant}.{extension}',
+                    ContentFile(buffer.getvalue())
+                )
+        Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_variants=variants)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        connection.close()
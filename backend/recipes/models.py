@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from users.models import Subscription
+
+from .search import SearchVectorField, SearchVectorIndex
+from .storage import content_addressed_storage
 
 User = get_user_model()
 
@@ -19,6 +24,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name', ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -50,6 +61,47 @@ class Tag(models.Model):
         return self.slug
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Выборка рецептов для чтения через API."""
+
+    @staticmethod
+    def get_prefetches():
+        return [
+            'tags',
+            Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')
+            ),
+        ]
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного, покупок и подписки на автора."""
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                author_is_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(Purchase.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+    def for_user(self, user):
+        """Аннотирует флаги текущего пользователя и подгружает связи.
+
+        Для списка рецептов выполняется постоянное число запросов
+        независимо от размера страницы.
+        """
+        return self.with_user_flags(user).select_related(
+            'author').prefetch_related(*self.get_prefetches())
+
+
 class Recipe(models.Model):
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -65,8 +117,15 @@ class Recipe(models.Model):
     image = models.ImageField(
         blank=True,
         upload_to='recipes/images',
+        storage=content_addressed_storage,
         verbose_name='Изображение'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     name = models.CharField(
         max_length=200,
         verbose_name='Название'
@@ -91,11 +150,42 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый индекс'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date', ]
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular_idx'
+            ),
+            SearchVectorIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -208,3 +298,61 @@ class Purchase(models.Model):
                 fields=['user', 'recipe'], name='unique_purchase'
             )
         ]
+
+
+class CartIngredient(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='cart_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='cart_ingredients'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient.name}, {self.amount}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора в ленте подписчика, добавленный при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_entries'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_entry'
+            )
+        ]
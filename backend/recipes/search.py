@@ -0,0 +1,51 @@
+from django.db import connections, models
+
+SEARCH_CONFIG = 'russian'
+
+
+class SearchVectorField(models.Field):
+    """Колонка tsvector в PostgreSQL и текстовая колонка в остальных СУБД.
+
+    Поле из django.contrib.postgres требует psycopg2 при импорте моделей,
+    а это поле позволяет запускать проект и на SQLite.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'tsvector'
+        return 'text'
+
+
+@SearchVectorField.register_lookup
+class SearchMatch(models.Lookup):
+    """Оператор @@: документ соответствует поисковому запросу."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ {rhs}', [*lhs_params, *rhs_params]
+
+
+class SearchVectorIndex(models.Index):
+    """GIN-индекс в PostgreSQL и обычный индекс в остальных СУБД."""
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            using = ' USING gin'
+        return super().create_sql(
+            model, schema_editor, using=using, **kwargs)
+
+
+def update_search_vectors(queryset):
+    """Пересчитывает search_vector рецептов по названию и описанию.
+
+    Название весит больше описания. Вне PostgreSQL ничего не делает.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return
+    from django.contrib.postgres.search import SearchVector
+    queryset.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    ))
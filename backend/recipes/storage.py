@@ -0,0 +1,74 @@
+import os
+from hashlib import sha256
+from pathlib import PurePosixPath
+from tempfile import mkstemp
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хэш его содержимого.
+
+    Повторная загрузка тех же байтов не создает новый файл, а возвращает
+    имя уже сохраненного и обновляет время его изменения: так сборщик
+    collect_recipe_images не удалит файл, на который вот-вот сошлется
+    новый рецепт. Файлы никогда не перезаписываются, поэтому их можно
+    отдавать с бессрочными заголовками кэширования.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        path = PurePosixPath(name)
+        content_hash = digest.hexdigest()
+        name = str(
+            path.parent / content_hash[:2] / f'{content_hash}{path.suffix}')
+        full_path = self.path(name)
+        try:
+            os.utime(full_path)
+        except FileNotFoundError:
+            self._write(full_path, content)
+        return name
+
+    def _write(self, full_path, content):
+        """Атомарно кладет файл под итоговое имя.
+
+        Байты пишутся во временный файл рядом с итоговым и затем
+        появляются под хэш-именем одной операцией, поэтому недописанный
+        файл никогда не виден под этим именем. Если параллельная загрузка
+        тех же байтов успела раньше, ее файл остается на месте.
+        """
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+            try:
+                os.makedirs(
+                    directory, self.directory_permissions_mode, exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            try:
+                os.link(temp_path, full_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                os.replace(temp_path, full_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+content_addressed_storage = ContentAddressedStorage()